@@ -1,4 +1,17 @@
+import concurrent.futures
 import math
+import mmap
+import operator
+import os
+import random
+import struct
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, the pure Python paths are used without it
+    np = None
 
 """
 A solver for the n-queens problem, wherein n queens are to be placed on an n x n chessboard 
@@ -51,64 +64,569 @@ def n_queens_valid(board):
 
     return True
 
-def n_queens_solutions(n: int):
+def n_queens_valid_large(board):
+    # Time complexity: O(n)
+
+    # Same answer as n_queens_valid, meant for boards with thousands to millions of queens.
+    # The column and diagonal numbers of every queen are computed in bulk (with NumPy if installed,
+    # otherwise with map over the whole board) and checked for duplicates without a Python-level loop
+
+    n = len(board)
+    if n == 0:
+        return True
+
+    if np is not None:
+        cols = np.asarray(board, dtype=np.int64)
+        if cols.min() < 0 or cols.max() >= n:
+            return False
+        rows = np.arange(n, dtype=np.int64)
+        return (np.bincount(cols, minlength=n).max() == 1
+                and np.bincount(rows - cols + n - 1).max() == 1
+                and np.bincount(rows + cols).max() == 1)
+
+    if min(board) < 0 or max(board) >= n:
+        return False
+    rows = range(n)
+    return (len(set(board)) == n
+            and len(set(map(operator.sub, rows, board))) == n
+            and len(set(map(operator.add, rows, board))) == n)
+
+def n_queens_min_conflicts(n: int, seed=None, max_restarts: int = 100):
+    # Expected time complexity: O(n) in practice
+
+    # Finds one solution by local search rather than backtracking, fast enough for n in the millions.
+    # Returns the board as an array('i') of columns by row, or None for n = 2 and n = 3
+    # (or if every restart got stuck, which does not happen in practice for larger n)
+
+    # The board is kept a permutation of the columns, so no two queens ever share a column and only
+    # the diagonals can conflict. dips[row - col + n - 1] and rises[row + col] count the queens on
+    # each diagonal, and swapping the columns of two rows updates the four affected counters of each
+    if n in (2, 3):
+        return None
+    if n < 2:
+        return array('i', range(n))
+
+    rng = random.Random(seed)
+    uniform = rng.random
+    last = n - 1
+
+    for _ in range(max_restarts):
+        board = array('i', range(n))
+        dips = array('i', [0]) * (2 * n - 1)
+        rises = array('i', [0]) * (2 * n - 1)
+
+        # Greedy start: fill rows top to bottom, swapping in a random remaining column whose
+        # diagonals are still empty. A few tries per row place nearly every queen without conflicts;
+        # rows that run out of tries keep a random column and are left for the repair phase
+        conflicted = []
+        for row in range(n):
+            span = n - row
+            for _ in range(50):
+                other = row + int(uniform() * span)
+                col = board[other]
+                dip = row - col + last
+                rise = row + col
+                if not dips[dip] and not rises[rise]:
+                    break
+            board[other] = board[row]
+            board[row] = col
+            if dips[dip] or rises[rise]:
+                conflicted.append(row)
+            dips[dip] += 1
+            rises[rise] += 1
+
+        # Pairs of queens sharing a diagonal; a diagonal with k queens holds k * (k - 1) / 2 pairs
+        collisions = sum(k * (k - 1) // 2 for k in dips if k > 1) + sum(k * (k - 1) // 2 for k in rises if k > 1)
+
+        def swap(a, b):
+            # Swaps the columns of rows a and b and returns the change in collisions
+            ca, cb = board[a], board[b]
+            change = 0
+            for row, col in ((a, ca), (b, cb)):
+                dips[row - col + last] -= 1
+                rises[row + col] -= 1
+                change -= dips[row - col + last] + rises[row + col]
+            board[a], board[b] = cb, ca
+            for row, col in ((a, cb), (b, ca)):
+                change += dips[row - col + last] + rises[row + col]
+                dips[row - col + last] += 1
+                rises[row + col] += 1
+            return change
+
+        # Repair: move each attacked queen by swapping it with a random row, keeping only the swaps
+        # that lower the number of collisions. Stop and restart if a long stretch brings no progress
+        stalled = 0
+        while collisions and stalled < 50:
+            attacked = [row for row in conflicted
+                        if dips[row - board[row] + last] > 1 or rises[row + board[row]] > 1]
+            if not attacked:
+                attacked = [row for row in range(n)
+                            if dips[row - board[row] + last] > 1 or rises[row + board[row]] > 1]
+            conflicted = attacked
+            before = collisions
+            for row in attacked:
+                if dips[row - board[row] + last] < 2 and rises[row + board[row]] < 2:
+                    continue
+                for _ in range(4 * n if n < 1000 else 1000):
+                    other = int(uniform() * n)
+                    if other == row:
+                        continue
+                    change = swap(row, other)
+                    if change < 0:
+                        collisions += change
+                        conflicted.append(other)
+                        break
+                    swap(row, other)  # Undo
+            stalled = stalled + 1 if collisions >= before else 0
+
+        if not collisions:
+            return board
+
+    return None
+
+def place_queens(n: int, prefix):
+    # Time complexity: O(k)
+    # k is the length of the prefix
+
+    # Places queens in the first rows, prefix[row] = col, and returns the (cols, dips, rises)
+    # bitboards for the next row as used by n_queens_solutions, or None if two of them attack each other
+
+    full = (1 << n) - 1
+    cols = dips = rises = 0
+    for col in prefix:
+        if not 0 <= col < n or (1 << col) & (cols | dips | rises):
+            return None
+        bit = 1 << col
+        cols |= bit
+        dips = ((dips | bit) << 1) & full
+        rises = (rises | bit) >> 1
+    return cols, dips, rises
+
+
+def n_queens_solutions(n: int, mirror: bool = False, prefix=()):
     # Worst-case time complexity: O(n!)
 
-    # Sets to keep track of columns and diagonals where queens are already placed
-    cols = set()
-    dips = set()   # row - col
-    rises = set()  # row + col
+    # With a `prefix`, only yields the solutions whose first rows hold those columns
+
+    # Bitboards of the squares attacked in the current row; bit c stands for column c
+    # cols:  columns that already hold a queen
+    # dips:  squares on a decreasing diagonal (row - col) of a queen above, moved one column right per row
+    # rises: squares on an increasing diagonal (row + col) of a queen above, moved one column left per row
+    full = (1 << n) - 1
     # List to represent the current board state; board[row] = col of queen
     board = [None] * n
 
-    def backtrack(row: int):
+    def backtrack(row: int, cols: int, dips: int, rises: int, free: int):
 
         """
-        Try to place a queen in `row` and recursively solve for next rows.
+        Try to place a queen on each of the `free` squares of `row` and recursively solve for next rows.
         Yields all valid board configurations.
         """
-        
+
         # Base case - all rows have been processed
         # Yield a copy of the current board (which has determined to be the solution)
         if row == n:
             yield list(board)
             return
 
-        # Try placing the queen in each column of the current row
-        for col in range(n):
-            # A queen is safe if:
-            # The column is not already occupied
-            # The decreasing diagonal (row - col) is not already occupied
-            # The increasing diagonal (row + col) is not already occupied
-            if (col in cols) or ((row - col) in dips) or ((row + col) in rises):
-                continue
-
-            # Mark the queen's position, log the column and diagonals used
-            cols.add(col)
-            dips.add(row - col)
-            rises.add(row + col)
+        # Visit only the free squares, lowest column first
+        while free:
+            bit = free & -free  # Lowest set bit
+            free ^= bit
+            board[row] = bit.bit_length() - 1
+
+            # Mark the queen's column and diagonals, then move the diagonals on to the next row
+            next_cols = cols | bit
+            next_dips = ((dips | bit) << 1) & full
+            next_rises = (rises | bit) >> 1
+            yield from backtrack(row + 1, next_cols, next_dips, next_rises,
+                                 full & ~(next_cols | next_dips | next_rises))  # Recurse
+
+    if prefix:
+        if mirror:
+            raise ValueError("mirror mode cannot be combined with a prefix")
+        masks = place_queens(n, prefix)
+        if masks is None:
+            return
+        cols, dips, rises = masks
+        board[:len(prefix)] = prefix
+        yield from backtrack(len(prefix), cols, dips, rises, full & ~(cols | dips | rises))
+        return
+
+    if not mirror or n < 2:
+        yield from backtrack(0, 0, 0, 0, full)  # Backtracking begins from the first row
+        return
+
+    # Mirror mode halves the work but gives up lexicographic order:
+    # every solution has a mirror image (col -> n - 1 - col) with its first queen in the other half,
+    # so only the left half of the first row is searched and each solution is yielded with its mirror
+    half = n // 2
+    for solution in backtrack(0, 0, 0, 0, (1 << half) - 1):
+        yield solution
+        yield [n - 1 - col for col in solution]
+
+    if n % 2:
+        # A first queen in the middle column mirrors onto itself, so the second row decides the half
+        middle = 1 << half
+        board[0] = half
+        dips, rises = (middle << 1) & full, middle >> 1
+        for solution in backtrack(1, middle, dips, rises, full & ~(middle | dips | rises) & (middle - 1)):
+            yield solution
+            yield [n - 1 - col for col in solution]
+
+
+def n_queens_count(n: int, prefix=()):
+    # Worst-case time complexity: O(n!), about half the work of enumerating
+
+    # Counts the solutions without building any boards, using the same bitboards
+    # and mirror symmetry as n_queens_solutions(n, mirror=True)
+    # With a `prefix`, only counts the solutions whose first rows hold those columns
+
+    full = (1 << n) - 1
+
+    def count(cols: int, dips: int, rises: int, free: int):
+        if cols == full:
+            return 1
+
+        total = 0
+        while free:
+            bit = free & -free  # Lowest set bit
+            free ^= bit
+            next_cols = cols | bit
+            next_dips = ((dips | bit) << 1) & full
+            next_rises = (rises | bit) >> 1
+            total += count(next_cols, next_dips, next_rises, full & ~(next_cols | next_dips | next_rises))
+        return total
+
+    if prefix:
+        masks = place_queens(n, prefix)
+        if masks is None:
+            return 0
+        cols, dips, rises = masks
+        return count(cols, dips, rises, full & ~(cols | dips | rises))
+
+    if n < 2:
+        return 1  # The empty board and the single queen
+
+    half = n // 2
+    total = 2 * count(0, 0, 0, (1 << half) - 1)
+
+    if n % 2:
+        # First queen in the middle column; the second row decides the half
+        middle = 1 << half
+        dips, rises = (middle << 1) & full, middle >> 1
+        total += 2 * count(middle, dips, rises, full & ~(middle | dips | rises) & (middle - 1))
+
+    return total
+
+
+def n_queens_fundamental_solutions(n: int):
+    # Worst-case time complexity: O(n!), with most non-canonical branches cut early
+
+    # Yields (board, class_size) for every class of solutions under rotation and reflection.
+    # The board is the class representative, the lexicographically smallest of its 8 images,
+    # and class_size (1, 2, 4 or 8) is how many distinct solutions the class holds,
+    # so sum(class_size) over all yielded boards equals the total number of solutions
+
+    full = (1 << n) - 1
+    last = n - 1
+    board = [None] * n    # board[row] = col of queen
+    col_row = [None] * n  # col_row[col] = row of queen
+
+    # The 7 other symmetries as (source, reversed, flipped): row j of the board's image is
+    # source[last - j if reversed else j], mirrored to last - value if flipped,
+    # or None while the queen that lands in that row is not placed yet
+    images = [
+        (col_row, False, True),  # Rotate 90
+        (board, True, True),     # Rotate 180
+        (col_row, True, False),  # Rotate 270
+        (board, False, True),    # Mirror left-right
+        (board, True, False),    # Mirror top-bottom
+        (col_row, False, False), # Transpose
+        (col_row, True, True),   # Anti-transpose
+    ]
+
+    def compare(source, reverse, flip):
+        # Returns -1, 0 or 1 as the image is smaller, equal or larger than the board,
+        # comparing row by row, or None while the rows needed to decide are not all known
+        for j in range(n):
+            mine = board[j]
+            theirs = source[last - j] if reverse else source[j]
+            if mine is None or theirs is None:
+                return None
+            if flip:
+                theirs = last - theirs
+            if theirs != mine:
+                return -1 if theirs < mine else 1
+        return 0
+
+    def backtrack(row: int, cols: int, dips: int, rises: int, free: int):
+        if row == n:
+            order = [compare(*image) for image in images]
+            if -1 not in order:
+                # Every symmetry mapping the board onto itself shrinks its class
+                yield list(board), 8 // (1 + order.count(0))
+            return
+
+        while free:
+            bit = free & -free  # Lowest set bit
+            free ^= bit
+            col = bit.bit_length() - 1
             board[row] = col
+            col_row[col] = row
 
-            yield from backtrack(row + 1) # Recurse
+            # A rotated or transposed image starts with the row of the queen in an edge column,
+            # so once one is placed, prune if the partial board already loses to some image
+            if (col != 0 and col != last) or all(compare(*image) != -1 for image in images):
+                next_cols = cols | bit
+                next_dips = ((dips | bit) << 1) & full
+                next_rises = (rises | bit) >> 1
+                yield from backtrack(row + 1, next_cols, next_dips, next_rises,
+                                     full & ~(next_cols | next_dips | next_rises))
 
-            # Backtrack to explore other placements by removing the queen 
-            # and unmarking the column and diagonals
-            cols.remove(col)
-            dips.remove(row - col)
-            rises.remove(row + col)
             board[row] = None
+            col_row[col] = None
 
-    yield from backtrack(0) # Backtracking begins from the first row
+    # The mirror image of a representative never starts further left, so its first queen sits in the left half
+    yield from backtrack(0, 0, 0, 0, (1 << (n + 1) // 2) - 1)
 
 
 # Bonus function to return all solutions as a list
 # Not included in original assignment
-def n_queens_solutions_all(n: int):
+def n_queens_solutions_all(n: int, workers=None):
     # Worst-case time complexity: O(n!)
 
+    # With `workers`, the search is spread over a process pool (same order as the serial search)
+    if workers:
+        return list(n_queens_solutions_parallel(n, workers, ordered=True))
+
     solutions = []
 
     for solution in n_queens_solutions(n):
         solutions.append(solution)
 
     return solutions
+
+
+# Parallel search
+# The search tree is cut after the first `depth` rows; every valid placement of those rows (a prefix)
+# is an independent subproblem. Subtree sizes vary a lot, so there are many more prefixes than workers
+# and each worker takes the next prefix as soon as it is done, which keeps all cores busy until the end
+
+def n_queens_prefixes(n: int, depth: int, mirror: bool = False):
+    # Time complexity: O(n^depth)
+
+    # Yields (prefix, weight) for every valid placement of the first `depth` rows, in lexicographic order
+    # With `mirror`, only prefixes whose mirror image is not yielded are kept, weighted 2
+    # (weight 1 when a prefix mirrors onto itself, i.e. every queen in the middle column)
+
+    def extend(prefix):
+        if len(prefix) == depth:
+            yield prefix
+            return
+        for col in range(n):
+            if place_queens(n, prefix + (col,)) is not None:
+                yield from extend(prefix + (col,))
+
+    for prefix in extend(()):
+        if not mirror:
+            yield prefix, 1
+            continue
+        mirrored = tuple(n - 1 - col for col in prefix)
+        if prefix < mirrored:
+            yield prefix, 2
+        elif prefix == mirrored:
+            yield prefix, 1
+
+
+def choose_prefix_depth(n: int, workers: int):
+    # Picks the shallowest cut giving at least 32 prefixes per worker, for even load balancing
+
+    depth = 0
+    prefixes = 1
+    while depth < n and prefixes < 32 * workers:
+        depth += 1
+        prefixes = sum(1 for _ in n_queens_prefixes(n, depth))
+    return depth
+
+
+def _count_prefix(task):
+    # Worker: counts the solutions below one prefix, scaled by its weight
+    n, prefix, weight = task
+    return weight * n_queens_count(n, prefix)
+
+
+def _solve_prefix(task):
+    # Worker: returns the solutions below one prefix packed as bytes, n bytes per solution
+    # (one byte per row for n < 256, two for larger boards), far cheaper to send back than lists
+    n, prefix = task
+    width = 1 if n < 256 else 2
+    return b"".join(b"".join(col.to_bytes(width, "little") for col in solution)
+                    for solution in n_queens_solutions(n, prefix=prefix))
+
+
+def _unpack_solutions(n, packed):
+    width = 1 if n < 256 else 2
+    step = n * width
+    for start in range(0, len(packed), step):
+        chunk = packed[start:start + step]
+        yield [int.from_bytes(chunk[i:i + width], "little") for i in range(0, step, width)]
+
+
+def n_queens_count_parallel(n: int, workers=None, depth=None):
+    # Worst-case time complexity: O(n! / workers)
+
+    # Counts the solutions over a process pool, searching only prefixes that are not mirror images
+    workers = workers or os.cpu_count() or 1
+    depth = choose_prefix_depth(n, workers) if depth is None else depth
+    if n < 2 or depth == 0:
+        return n_queens_count(n)
+
+    tasks = [(n, prefix, weight) for prefix, weight in n_queens_prefixes(n, depth, mirror=True)]
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        return sum(pool.map(_count_prefix, tasks))
+
+
+def n_queens_solutions_parallel(n: int, workers=None, depth=None, ordered: bool = False):
+    # Worst-case time complexity: O(n! / workers)
+
+    # Yields all solutions, computed over a process pool
+    # In completion order by default; with `ordered`, in the same lexicographic order as n_queens_solutions
+    workers = workers or os.cpu_count() or 1
+    depth = choose_prefix_depth(n, workers) if depth is None else depth
+    if depth == 0:
+        yield from n_queens_solutions(n)
+        return
+
+    tasks = [(n, prefix) for prefix, _ in n_queens_prefixes(n, depth)]
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        if ordered:
+            # map hands prefixes out as workers free up but returns results in prefix order
+            results = pool.map(_solve_prefix, tasks)
+        else:
+            results = (future.result() for future in
+                       concurrent.futures.as_completed([pool.submit(_solve_prefix, task) for task in tasks]))
+        for packed in results:
+            yield from _unpack_solutions(n, packed)
+
+
+# Binary solution files
+# A small header followed by every solution packed row by row, n values per solution:
+# one byte per row for n < 256, two little-endian bytes for larger boards (the same packing the parallel
+# workers send back). Files are written in chunks as solutions stream in and read back through mmap,
+# so millions of solutions can be indexed without ever holding them all in memory as lists
+
+SOLUTION_MAGIC = b"NQSF"
+SOLUTION_VERSION = 1
+SOLUTION_HEADER = "<4sHHIQ"  # magic, version, bytes per row, n, number of solutions
+
+
+def n_queens_export(n: int, path, workers=None, chunk_size: int = 65536):
+    # Worst-case time complexity: O(n!)
+
+    # Writes every solution of the n-queens problem to `path` and returns how many there were.
+    # Solutions are buffered `chunk_size` at a time, so memory use stays flat whatever the count.
+    # With `workers`, the search runs over a process pool and the packed results are written as they arrive.
+    # The file is written next to `path` and moved into place once complete
+    width = 1 if n < 256 else 2
+    header_size = struct.calcsize(SOLUTION_HEADER)
+    temp_path = "%s.%d.tmp" % (path, os.getpid())
+    count = 0
+
+    with open(temp_path, "wb") as f:
+        f.write(bytes(header_size))  # The count is only known at the end
+
+        if workers and n > 0:
+            depth = choose_prefix_depth(n, workers)
+            tasks = [(n, prefix) for prefix, _ in n_queens_prefixes(n, depth)] if depth else [(n, ())]
+            with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                # Already packed by the workers, in the same order as the serial search
+                for packed in pool.map(_solve_prefix, tasks):
+                    f.write(packed)
+                    count += len(packed) // (n * width)
+        else:
+            chunk = array("B" if width == 1 else "H")
+            for solution in n_queens_solutions(n):
+                chunk.extend(solution)
+                count += 1
+                if count % chunk_size == 0:
+                    _write_packed(f, chunk)
+                    del chunk[:]
+            _write_packed(f, chunk)
+
+        f.seek(0)
+        f.write(struct.pack(SOLUTION_HEADER, SOLUTION_MAGIC, SOLUTION_VERSION, width, n, count))
+
+    os.replace(temp_path, path)
+    return count
+
+
+def _write_packed(f, chunk):
+    if chunk.itemsize > 1 and sys.byteorder == "big":
+        chunk = array(chunk.typecode, chunk)
+        chunk.byteswap()
+    f.write(chunk.tobytes())
+
+
+class SolutionFile(object):
+    """
+    Read-only, memory-mapped view of a file written by n_queens_export.
+    Behaves like a sequence of solutions: len(), indexing, slicing and iteration
+    decode only the rows they touch. Use as a context manager or call close() when done
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header_size = struct.calcsize(SOLUTION_HEADER)
+        magic, version, self.width, self.n, self.count = struct.unpack_from(SOLUTION_HEADER, self.data, 0)
+        if magic != SOLUTION_MAGIC or version != SOLUTION_VERSION:
+            raise ValueError("%s is not a version %d n-queens solution file" % (path, SOLUTION_VERSION))
+        if len(self.data) != header_size + self.count * self.n * self.width:
+            raise ValueError("%s is truncated or corrupt" % path)
+
+        self.offset = header_size
+        # Native-order view of every packed row; big-endian machines swap bytes when decoding instead
+        self.swap = self.width > 1 and sys.byteorder == "big"
+        self.rows = memoryview(self.data)[header_size:].cast("B" if self.width == 1 else "H")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("solution index out of range")
+        row = self.rows[index * self.n:(index + 1) * self.n]
+        if self.swap:
+            row = array("H", row)
+            row.byteswap()
+        return list(row)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def as_array(self):
+        """
+        Returns the solutions as a read-only (count, n) NumPy array backed by the mapping, without copying
+        """
+        if np is None:
+            raise ImportError("as_array() needs NumPy; index the SolutionFile directly instead")
+        dtype = np.uint8 if self.width == 1 else np.dtype("<u2")
+        return np.frombuffer(self.data, dtype=dtype, count=self.count * self.n,
+                             offset=self.offset).reshape(self.count, self.n)
+
+    def close(self):
+        self.rows.release()
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,9 +1,20 @@
+import os
+import tempfile
 import unittest
 from n_queens import (
     num_placements_all,
     num_placements_one_per_row,
     n_queens_valid,
-    n_queens_solutions
+    n_queens_valid_large,
+    n_queens_solutions,
+    n_queens_count,
+    n_queens_solutions_all,
+    n_queens_count_parallel,
+    n_queens_solutions_parallel,
+    n_queens_fundamental_solutions,
+    n_queens_min_conflicts,
+    n_queens_export,
+    SolutionFile
 )
 
 class TestNQueens(unittest.TestCase):
@@ -59,5 +70,98 @@ class TestNQueens(unittest.TestCase):
         self.assertEqual(len(list(n_queens_solutions(5))), 10)
         self.assertEqual(len(list(n_queens_solutions(6))), 4)
 
+    # Test that the generator keeps lexicographic order and that mirror mode finds the same solutions
+    def test_n_queens_solutions_order(self):
+        self.assertEqual(list(n_queens_solutions(4)), [[1, 3, 0, 2], [2, 0, 3, 1]])
+        for n in range(1, 9):
+            solutions = list(n_queens_solutions(n))
+            self.assertEqual(solutions, sorted(solutions))
+            self.assertEqual(sorted(n_queens_solutions(n, mirror=True)), solutions)
+
+    # Test the counting-only mode against the known solution counts
+    def test_n_queens_count(self):
+        self.assertEqual(n_queens_count(0), 1)
+        self.assertEqual(n_queens_count(1), 1)
+        self.assertEqual(n_queens_count(2), 0)
+        self.assertEqual(n_queens_count(3), 0)
+        self.assertEqual(n_queens_count(6), 4)
+        self.assertEqual(n_queens_count(8), 92)
+        self.assertEqual(n_queens_count(9), 352)
+        self.assertEqual(n_queens_count(10), 724)
+
+    # Test that a prefix restricts the search to solutions starting with those columns
+    def test_n_queens_prefix(self):
+        self.assertEqual(list(n_queens_solutions(4, prefix=[1])), [[1, 3, 0, 2]])
+        self.assertEqual(list(n_queens_solutions(4, prefix=[0])), [])
+        self.assertEqual(list(n_queens_solutions(4, prefix=[0, 1])), [])  # Queens attack each other
+        self.assertEqual(n_queens_count(8, prefix=[0]), 4)
+
+    # Test that the parallel search finds the same solutions, in serial order when asked to
+    def test_n_queens_parallel(self):
+        solutions = list(n_queens_solutions(8))
+        self.assertEqual(list(n_queens_solutions_parallel(8, workers=2, ordered=True)), solutions)
+        self.assertEqual(sorted(n_queens_solutions_parallel(8, workers=2, depth=3)), solutions)
+        self.assertEqual(n_queens_solutions_all(7, workers=2), list(n_queens_solutions(7)))
+        self.assertEqual(n_queens_count_parallel(9, workers=2), 352)
+        self.assertEqual(n_queens_count_parallel(8, workers=2, depth=2), 92)
+
+    # Test that one representative per symmetry class is found and the class sizes add up to every solution
+    def test_n_queens_fundamental_solutions(self):
+        self.assertEqual(list(n_queens_fundamental_solutions(1)), [([0], 1)])
+        self.assertEqual(list(n_queens_fundamental_solutions(3)), [])
+        self.assertEqual(list(n_queens_fundamental_solutions(4)), [([1, 3, 0, 2], 2)])
+        self.assertEqual(list(n_queens_fundamental_solutions(6)), [([1, 3, 5, 0, 2, 4], 4)])
+        for n, fundamental, total in ((5, 2, 10), (7, 6, 40), (8, 12, 92), (10, 92, 724)):
+            classes = list(n_queens_fundamental_solutions(n))
+            self.assertEqual(len(classes), fundamental)
+            self.assertEqual(sum(size for _, size in classes), total)
+            self.assertTrue(all(n_queens_valid(board) for board, _ in classes))
+
+    # Test that the bulk validity check agrees with n_queens_valid
+    def test_n_queens_valid_large(self):
+        self.assertTrue(n_queens_valid_large([]))
+        self.assertTrue(n_queens_valid_large([1, 3, 0, 2]))
+        self.assertFalse(n_queens_valid_large([0, 2, 4, 1, 3, 3]))  # Same column
+        self.assertFalse(n_queens_valid_large([0, 2, 1, 3]))  # Same diagonal
+        self.assertFalse(n_queens_valid_large([1, 3, 0, 4]))  # Off the board
+        for board in n_queens_solutions(6):
+            self.assertTrue(n_queens_valid_large(board))
+
+    # Test that the local search finds valid boards, including a large one, and none where none exist
+    def test_n_queens_min_conflicts(self):
+        self.assertIsNone(n_queens_min_conflicts(2))
+        self.assertIsNone(n_queens_min_conflicts(3))
+        self.assertEqual(list(n_queens_min_conflicts(1)), [0])
+        for n in (4, 5, 8, 13):
+            for seed in range(5):
+                self.assertTrue(n_queens_valid(n_queens_min_conflicts(n, seed=seed)))
+        board = n_queens_min_conflicts(20000, seed=0)
+        self.assertEqual(len(board), 20000)
+        self.assertTrue(n_queens_valid_large(board))
+
+    # Test that exported solutions read back lazily and in order, serially and in parallel
+    def test_n_queens_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "solutions.bin")
+            solutions = list(n_queens_solutions(8))
+            self.assertEqual(n_queens_export(8, path, chunk_size=10), 92)
+            self.assertEqual(os.path.getsize(path), 20 + 92 * 8)  # Header plus one byte per row
+            with SolutionFile(path) as stored:
+                self.assertEqual(len(stored), 92)
+                self.assertEqual(stored[0], solutions[0])
+                self.assertEqual(stored[-1], solutions[-1])
+                self.assertEqual(stored[10:13], solutions[10:13])
+                self.assertEqual(list(stored), solutions)
+                with self.assertRaises(IndexError):
+                    stored[92]
+
+            self.assertEqual(n_queens_export(7, path, workers=2), 40)
+            with SolutionFile(path) as stored:
+                self.assertEqual(list(stored), list(n_queens_solutions(7)))
+
+            self.assertEqual(n_queens_export(3, path), 0)
+            with SolutionFile(path) as stored:
+                self.assertEqual(list(stored), [])
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
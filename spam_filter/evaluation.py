@@ -0,0 +1,337 @@
+import argparse
+import concurrent.futures
+import os
+import random
+import time
+from array import array
+from collections import Counter
+from math import log
+
+from spam_filter import HashedSpamFilter, SpamFilter, get_tokenizer, platt_scale
+
+'''
+Cross-validation and smoothing sweeps for the naive Bayes spam filter.
+
+The corpus is tokenized once into sparse per-email count vectors over a single vocabulary. The class counts
+of each training split are the corpus totals minus the counts of the held-out fold, so nothing is read or
+counted again per split, and every smoothing value is scored from the same shared counts across a process pool.
+The scores match a SpamFilter trained on the same split.
+
+    python evaluation.py --folds 10 --smoothing 0.01 0.1 0.5 1 2
+
+The same held-out scores calibrate a model: calibration() fits Platt scaling to them, and the result can
+be set as a model's `calibration` without holding any emails back from training.
+
+hashing_benchmark() instead compares HashedSpamFilter at several widths and depths with the exact model
+on a held-out split, for accuracy, agreement with the exact labels and memory:
+
+    python evaluation.py --hashed 1024x1 65536x1 65536x4
+'''
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "training")
+
+SPAM, HAM = 1, 0
+
+
+class Corpus(object):
+    """
+    Labelled emails as sparse token count vectors over one vocabulary.
+    Email i holds the vocabulary ids ids[offsets[i]:offsets[i + 1]] with the matching counts,
+    and labels[i] is SPAM or HAM. totals[label][w] is the count of word w over all emails of a class
+    """
+
+    def __init__(self, spam_paths, ham_paths, tokenizer=None, workers=None):
+        # Time complexity: O(n)
+        # n is the number of tokens in the corpus
+        self.tokenizer = tokenizer or get_tokenizer()
+        paths = list(spam_paths) + list(ham_paths)
+        self.labels = array("b", [SPAM] * (len(paths) - len(ham_paths)) + [HAM] * len(ham_paths))
+
+        if workers and workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                documents = list(pool.map(self.tokenizer.file_counts, paths, chunksize=64))
+        else:
+            documents = map(self.tokenizer.file_counts, paths)
+
+        self.words = []
+        index = {}
+        self.ids, self.counts, self.offsets = array("q"), array("q"), array("q", [0])
+        for document in documents:
+            for word, count in document.items():
+                i = index.get(word)
+                if i is None:
+                    i = index[word] = len(self.words)
+                    self.words.append(word)
+                self.ids.append(i)
+                self.counts.append(count)
+            self.offsets.append(len(self.ids))
+
+        size = len(self.words)
+        self.totals = (array("q", bytes(8 * size)), array("q", bytes(8 * size)))  # Indexed by HAM and SPAM
+        self.messages = [0, 0]
+        for email_id, label in enumerate(self.labels):
+            self.messages[label] += 1
+            totals = self.totals[label]
+            for position in range(self.offsets[email_id], self.offsets[email_id + 1]):
+                totals[self.ids[position]] += self.counts[position]
+        self.tokens = [sum(totals) for totals in self.totals]
+        self.seen = [sum(1 for count in totals if count) for totals in self.totals]
+
+    @classmethod
+    def from_dirs(cls, spam_dir, ham_dir, tokenizer=None, workers=None):
+        spam_paths = [os.path.join(spam_dir, f) for f in sorted(os.listdir(spam_dir))]
+        ham_paths = [os.path.join(ham_dir, f) for f in sorted(os.listdir(ham_dir))]
+        return cls(spam_paths, ham_paths, tokenizer, workers)
+
+    def __len__(self):
+        return len(self.labels)
+
+
+class Fold(object):
+    """
+    One held-out fold: its emails and, per class, the word counts, email count, token count and number of
+    words they remove from the totals, which turn the corpus totals into the counts of the training split
+    """
+
+    def __init__(self, corpus, members):
+        # Time complexity: O(m)
+        # m is the number of tokens in the fold
+        self.members = members
+        self.counts = (Counter(), Counter())
+        self.messages = [0, 0]
+        self.tokens = [0, 0]
+        for email_id in members:
+            label = corpus.labels[email_id]
+            self.messages[label] += 1
+            counts = self.counts[label]
+            for position in range(corpus.offsets[email_id], corpus.offsets[email_id + 1]):
+                counts[corpus.ids[position]] += corpus.counts[position]
+                self.tokens[label] += corpus.counts[position]
+        # Words whose whole count lies in this fold are unseen by the training split
+        self.lost = [sum(1 for word, count in self.counts[label].items() if corpus.totals[label][word] == count)
+                     for label in (HAM, SPAM)]
+
+
+def make_folds(corpus, k, seed=0):
+    """
+    Splits the corpus into k stratified folds: each class is shuffled with `seed` and dealt out in turn
+    k must be at least 2, since a single fold would leave nothing to train on
+    """
+    if k < 2:
+        raise ValueError("cross-validation needs at least 2 folds, not %d" % k)
+    rng = random.Random(seed)
+    members = [[] for _ in range(k)]
+    for label in (SPAM, HAM):
+        email_ids = [i for i, other in enumerate(corpus.labels) if other == label]
+        rng.shuffle(email_ids)
+        for position, email_id in enumerate(email_ids):
+            members[position % k].append(email_id)
+    return [Fold(corpus, sorted(fold)) for fold in members]
+
+
+def fold_log_odds(corpus, fold, smoothing, log_odds):
+    """
+    Scores the emails of `fold` with the model trained on every other fold, writing the log-odds of spam
+    into log_odds[email id]. Training counts are the corpus totals minus the fold's counts
+    """
+    # Time complexity: O(m)
+    # m is the number of tokens in the fold
+    denoms = [log(corpus.tokens[label] - fold.tokens[label]
+                  + smoothing * (corpus.seen[label] - fold.lost[label] + 1)) for label in (HAM, SPAM)]
+    bias = log(corpus.messages[SPAM] - fold.messages[SPAM]) - log(corpus.messages[HAM] - fold.messages[HAM])
+    # Every word, even one the training split never saw, has weight log(n_spam + s) - log(n_ham + s) + shift
+    shift = denoms[HAM] - denoms[SPAM]
+
+    spam_totals, ham_totals = corpus.totals[SPAM], corpus.totals[HAM]
+    spam_fold, ham_fold = fold.counts[SPAM], fold.counts[HAM]
+    ids, counts, offsets = corpus.ids, corpus.counts, corpus.offsets
+    for email_id in fold.members:
+        score = bias
+        for position in range(offsets[email_id], offsets[email_id + 1]):
+            word = ids[position]
+            score += counts[position] * (log(spam_totals[word] - spam_fold[word] + smoothing)
+                                         - log(ham_totals[word] - ham_fold[word] + smoothing) + shift)
+        log_odds[email_id] = score
+
+
+def metrics(labels, log_odds):
+    """
+    Accuracy, precision and recall (spam is the positive class, predicted when the log-odds are positive)
+    and the ROC AUC of the log-odds, computed from ranks with ties averaged
+    """
+    # Time complexity: O(n log n)
+    tp = fp = tn = fn = 0
+    for label, score in zip(labels, log_odds):
+        if score > 0:
+            tp, fp = (tp + 1, fp) if label == SPAM else (tp, fp + 1)
+        else:
+            fn, tn = (fn + 1, tn) if label == SPAM else (fn, tn + 1)
+
+    order = sorted(range(len(log_odds)), key=log_odds.__getitem__)
+    positive_ranks = 0.0
+    start = 0
+    while start < len(order):
+        end = start
+        while end + 1 < len(order) and log_odds[order[end + 1]] == log_odds[order[start]]:
+            end += 1
+        rank = (start + end) / 2.0 + 1  # Average rank of the tied run
+        positive_ranks += rank * sum(1 for i in order[start:end + 1] if labels[i] == SPAM)
+        start = end + 1
+    positives, negatives = tp + fn, tn + fp
+    auc = ((positive_ranks - positives * (positives + 1) / 2.0) / (positives * negatives)
+           if positives and negatives else None)
+
+    return {"accuracy": (tp + tn) / len(labels) if len(labels) else None,
+            "precision": tp / (tp + fp) if tp + fp else None,
+            "recall": tp / (tp + fn) if tp + fn else None,
+            "auc": auc}
+
+
+# Corpus and folds of each worker process, filled in by _init_worker
+_shared = {}
+
+
+def _init_worker(corpus, folds):
+    _shared.update(corpus=corpus, folds=folds)
+
+
+def _evaluate(smoothing):
+    """
+    Worker entry point: cross-validates one smoothing value over every fold
+    """
+    corpus, folds = _shared["corpus"], _shared["folds"]
+    start = time.perf_counter()
+    log_odds = array("d", bytes(8 * len(corpus)))
+    for fold in folds:
+        fold_log_odds(corpus, fold, smoothing, log_odds)
+    result = metrics(corpus.labels, log_odds)
+    result.update(smoothing=smoothing, seconds=time.perf_counter() - start)
+    return result
+
+
+def cross_validate(corpus, smoothings, k=10, seed=0, workers=None):
+    """
+    Runs k-fold cross-validation of every smoothing value on the corpus
+    Returns one dict per smoothing value, in order: smoothing, accuracy, precision, recall, auc and seconds
+    """
+    folds = make_folds(corpus, k, seed)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(smoothings) == 1:
+        _init_worker(corpus, folds)
+        return [_evaluate(smoothing) for smoothing in smoothings]
+
+    with concurrent.futures.ProcessPoolExecutor(min(workers, len(smoothings)), initializer=_init_worker,
+                                                initargs=(corpus, folds)) as pool:
+        return list(pool.map(_evaluate, smoothings))
+
+
+def calibration(corpus, smoothing, k=10, seed=0):
+    """
+    Fits Platt scaling to the out-of-fold log-odds of every email of the corpus, each scored by the model
+    trained on the other k - 1 folds. Returns (scale, offset), to be set as the `calibration` of a model
+    trained on the whole corpus with the same smoothing and tokenizer
+    """
+    # Time complexity: O(n)
+    # n is the number of tokens in the corpus
+    log_odds = array("d", bytes(8 * len(corpus)))
+    for fold in make_folds(corpus, k, seed):
+        fold_log_odds(corpus, fold, smoothing, log_odds)
+    return platt_scale(log_odds, corpus.labels)
+
+
+def results_table(results):
+    """
+    Formats one row per smoothing value
+    """
+    def number(value):
+        return "%.4f" % value if value is not None else "-"
+
+    header = ("smoothing", "accuracy", "precision", "recall", "auc", "seconds")
+    rows = [header] + [("%g" % result["smoothing"],) + tuple(number(result[name]) for name in header[1:])
+                       for result in results]
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def holdout_split(paths, every=5):
+    """
+    Splits sorted paths into (training, held out), holding out every `every`-th one
+    """
+    paths = sorted(paths)
+    return ([path for i, path in enumerate(paths) if i % every],
+            [path for i, path in enumerate(paths) if not i % every])
+
+
+def hashing_benchmark(spam_dir, ham_dir, configs, smoothing=1.0, tokenizer=None, workers=None, every=5):
+    """
+    Trains the exact model and a HashedSpamFilter per (width, depth) in `configs` on the same emails
+    and scores every model on the held-out ones
+    Returns one dict per model, exact first: name, accuracy, agreement with the exact labels,
+    approximate memory in bytes and training seconds
+    """
+    spam_train, spam_test = holdout_split(os.path.join(spam_dir, f) for f in os.listdir(spam_dir))
+    ham_train, ham_test = holdout_split(os.path.join(ham_dir, f) for f in os.listdir(ham_dir))
+    test = spam_test + ham_test
+    labels = [True] * len(spam_test) + [False] * len(ham_test)
+    tokenizer = tokenizer or get_tokenizer()
+    # Tokenize everything once, so the timings below measure counting rather than parsing
+    for path in spam_train + ham_train + test:
+        tokenizer.file_counts(path)
+
+    results = []
+    exact = None
+    for name, cls, options in [("exact", SpamFilter, {})] + [
+            ("%dx%d" % (width, depth), HashedSpamFilter, {"width": width, "depth": depth})
+            for width, depth in configs]:
+        started = time.perf_counter()
+        model = cls.from_paths(spam_train, ham_train, smoothing, workers, tokenizer, **options)
+        seconds = time.perf_counter() - started
+        predicted = [bool(label) for label in model.classify_many(test)[0]]
+        exact = exact or predicted
+        results.append({"model": name, "seconds": seconds, "memory": model.memory_bytes(),
+                        "accuracy": sum(a == b for a, b in zip(predicted, labels)) / len(labels),
+                        "agreement": sum(a == b for a, b in zip(predicted, exact)) / len(labels)})
+    return results
+
+
+def hashing_table(results):
+    """
+    Formats one row per model
+    """
+    header = ("model", "accuracy", "agreement", "memory MB", "seconds")
+    rows = [header] + [(result["model"], "%.4f" % result["accuracy"], "%.4f" % result["agreement"],
+                        "%.2f" % (result["memory"] / 1048576.0), "%.3f" % result["seconds"]) for result in results]
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-validate the spam filter over a grid of smoothing values")
+    parser.add_argument("--spam-dir", default=os.path.join(DATA_DIR, "spam"))
+    parser.add_argument("--ham-dir", default=os.path.join(DATA_DIR, "ham"))
+    parser.add_argument("--folds", type=int, default=10)
+    parser.add_argument("--smoothing", type=float, nargs="+", default=[0.01, 0.1, 0.5, 1.0, 2.0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--lowercase", action="store_true", help="case-fold tokens")
+    parser.add_argument("--headers", nargs="*", default=[], help="header fields to add as prefixed tokens")
+    parser.add_argument("--decode", action="store_true", help="decode encoded parts and headers")
+    parser.add_argument("--hashed", nargs="+", metavar="WIDTHxDEPTH",
+                        help="benchmark hashed models of these shapes against the exact one instead")
+    args = parser.parse_args()
+
+    tokenizer = get_tokenizer(args.lowercase, tuple(args.headers), args.decode)
+    if args.hashed:
+        configs = [tuple(int(part) for part in config.split("x")) for config in args.hashed]
+        print(hashing_table(hashing_benchmark(args.spam_dir, args.ham_dir, configs, args.smoothing[0],
+                                              tokenizer, args.workers)))
+        return
+
+    started = time.perf_counter()
+    corpus = Corpus.from_dirs(args.spam_dir, args.ham_dir, tokenizer, args.workers)
+    print("Tokenized %d emails (%d words) in %.2fs" % (len(corpus), len(corpus.words), time.perf_counter() - started))
+    print(results_table(cross_validate(corpus, args.smoothing, args.folds, args.seed, args.workers)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import struct
+import time
+from collections import deque
+
+from spam_filter import SpamFilter
+
+'''
+Asyncio classification service for the spam filter.
+
+Clients send raw message bytes over a Unix socket or localhost TCP and get back the label and log-odds.
+Requests arriving close together are gathered into micro-batches, closed when full or once the oldest
+request has waited `max_delay` seconds, and each batch is tokenized and scored by classify_many in an
+executor so the event loop stays free. With `workers` and a saved model, batches run in a process pool
+whose workers each memory-map the same model file.
+
+    python service.py serve --model model.bin --unix /tmp/spam_filter.sock
+    python service.py bench --unix /tmp/spam_filter.sock --concurrency 32
+
+Every frame starts with a one-byte kind and a payload length (REQUEST). A CLASSIFY request carries the raw
+message and is answered with RESULT; a STATS request has no payload and is answered with a length-prefixed
+JSON object of the server's counters.
+'''
+
+REQUEST = struct.Struct("!cI")  # kind, payload length
+RESULT = struct.Struct("!?d")  # is spam, log-odds of spam
+LENGTH = struct.Struct("!I")
+CLASSIFY, STATS = b"C", b"S"
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of `values`, or None if there are none
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LatencyStats(object):
+    """
+    Request and batch counters, with the latencies of the last `window` requests for percentiles
+    Throughput is requests per second since the service started
+    """
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.batches = 0
+        self.started = time.monotonic()
+
+    def record_batch(self, latencies):
+        self.batches += 1
+        self.requests += len(latencies)
+        self.latencies.extend(latencies)
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.started
+        p50, p99 = percentile(self.latencies, 0.5), percentile(self.latencies, 0.99)
+        return {"requests": self.requests, "batches": self.batches,
+                "mean_batch": self.requests / self.batches if self.batches else None,
+                "p50_ms": p50 * 1000 if p50 is not None else None,
+                "p99_ms": p99 * 1000 if p99 is not None else None,
+                "throughput": self.requests / elapsed if elapsed else None}
+
+
+# Model of each worker process, filled in by _init_worker
+_model = {}
+
+
+def _init_worker(model_path):
+    _model["filter"] = SpamFilter.load(model_path)
+
+
+def _classify_batch(messages, model=None):
+    """
+    Executor entry point: classifies a batch of raw messages, returning plain lists
+    """
+    labels, log_odds = (model or _model["filter"]).classify_many(messages)
+    return [bool(label) for label in labels], [float(score) for score in log_odds]
+
+
+class SpamService(object):
+    """
+    Serves one loaded model. Pass a SpamFilter as `model`, or the path of a saved one as `model_path`;
+    with `workers` > 1 (which needs `model_path`), batches are classified in that many processes
+    """
+
+    def __init__(self, model=None, model_path=None, max_batch=64, max_delay=0.005, workers=None):
+        if model is None and model_path is None:
+            raise ValueError("SpamService needs a model or a model_path")
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = LatencyStats()
+
+        if workers and workers > 1:
+            if model_path is None:
+                raise ValueError("running batches in worker processes needs a saved model_path")
+            self.model = None
+            self.executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                                   initargs=(model_path,))
+        else:
+            self.model = model if model is not None else SpamFilter.load(model_path)
+            self.executor = concurrent.futures.ThreadPoolExecutor(1)
+        self.slots = max(1, workers or 1)  # Batches in flight at once
+
+        self.pending = []  # (message, future, arrival time) waiting for the next batch
+        self.arrived = None
+        self.server = None
+        self.batcher = None
+        self.connections = {}  # Handler task -> reader of each open connection
+
+    async def classify(self, message):
+        """
+        Queues one raw message for the next batch and returns (is spam, log-odds) once it is scored
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((message, future, time.monotonic()))
+        self.arrived.set()
+        return await future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.slots)
+        while True:
+            await self.arrived.wait()
+            # Wait for more requests until the batch is full or its oldest request reaches the deadline
+            deadline = self.pending[0][2] + self.max_delay
+            while len(self.pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.arrived.clear()
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            if not self.pending:
+                self.arrived.clear()
+            await slots.acquire()
+            loop.create_task(self._run(batch, slots))
+
+    async def _run(self, batch, slots):
+        loop = asyncio.get_running_loop()
+        try:
+            messages = [message for message, _, _ in batch]
+            model = self.model
+            labels, log_odds = await loop.run_in_executor(
+                self.executor, _classify_batch, messages, *((model,) if model is not None else ()))
+        except Exception as error:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        finally:
+            slots.release()
+
+        now = time.monotonic()
+        self.stats.record_batch([now - arrival for _, _, arrival in batch])
+        for (_, future, _), label, score in zip(batch, labels, log_odds):
+            if not future.done():
+                future.set_result((label, score))
+
+    async def _handle(self, reader, writer):
+        """
+        Serves one connection, one request at a time
+        """
+        self.connections[asyncio.current_task()] = reader
+        try:
+            while True:
+                kind, length = REQUEST.unpack(await reader.readexactly(REQUEST.size))
+                payload = await reader.readexactly(length)
+                if kind == CLASSIFY:
+                    label, score = await self.classify(payload)
+                    writer.write(RESULT.pack(label, score))
+                elif kind == STATS:
+                    data = json.dumps(self.stats.as_dict()).encode("utf-8")
+                    writer.write(LENGTH.pack(len(data)) + data)
+                else:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self.connections[asyncio.current_task()]
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8025, unix_path=None):
+        """
+        Starts listening on `unix_path` if given, otherwise on host:port
+        """
+        self.arrived = asyncio.Event()
+        self.batcher = asyncio.get_running_loop().create_task(self._batch_loop())
+        if unix_path is not None:
+            self.server = await asyncio.start_unix_server(self._handle, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server
+
+    async def close(self):
+        """
+        Stops listening, closes open connections once their current request is answered, and shuts down
+        """
+        self.server.close()
+        handlers = list(self.connections)
+        for reader in self.connections.values():
+            reader.feed_eof()  # Ends the handler at its next read
+        await asyncio.gather(*handlers, return_exceptions=True)
+        await self.server.wait_closed()
+        self.batcher.cancel()
+        # Waiting for batches still in the executor would block the event loop, so wait in a thread
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+
+
+class SpamClient(object):
+    """
+    One connection to a SpamService
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=8025, unix_path=None):
+        if unix_path is not None:
+            return cls(*await asyncio.open_unix_connection(unix_path))
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def classify(self, message):
+        """
+        Returns (is spam, log-odds) for the raw bytes of one message
+        """
+        self.writer.write(REQUEST.pack(CLASSIFY, len(message)) + message)
+        await self.writer.drain()
+        return RESULT.unpack(await self.reader.readexactly(RESULT.size))
+
+    async def stats(self):
+        """
+        Returns the server's counters
+        """
+        self.writer.write(REQUEST.pack(STATS, 0))
+        await self.writer.drain()
+        (length,) = LENGTH.unpack(await self.reader.readexactly(LENGTH.size))
+        return json.loads(await self.reader.readexactly(length))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def replay(paths, host="127.0.0.1", port=8025, unix_path=None, concurrency=16, repeat=1):
+    """
+    Load generator: sends every file in `paths` (`repeat` times over) to the service from `concurrency`
+    connections at once. Returns client-side throughput and latency percentiles, the labels in the
+    order of `paths` (from the last pass), and the server's own counters
+    """
+    messages = []
+    for path in paths:
+        with open(path, "rb") as f:
+            messages.append(f.read())
+    jobs = iter([index for _ in range(repeat) for index in range(len(messages))])
+    labels = [None] * len(messages)
+    latencies = []
+
+    async def connection():
+        client = await SpamClient.connect(host, port, unix_path)
+        try:
+            for index in jobs:
+                sent = time.monotonic()
+                labels[index], _ = await client.classify(messages[index])
+                latencies.append(time.monotonic() - sent)
+        finally:
+            await client.close()
+
+    started = time.monotonic()
+    await asyncio.gather(*[connection() for _ in range(concurrency)])
+    elapsed = time.monotonic() - started
+
+    client = await SpamClient.connect(host, port, unix_path)
+    server = await client.stats()
+    await client.close()
+    return {"requests": len(latencies), "seconds": elapsed, "throughput": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.5) * 1000, "p99_ms": percentile(latencies, 0.99) * 1000,
+            "labels": labels, "server": server}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spam filter classification service")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("serve", "bench"):
+        command = commands.add_parser(name)
+        command.add_argument("--host", default="127.0.0.1")
+        command.add_argument("--port", type=int, default=8025)
+        command.add_argument("--unix", help="Unix socket path, used instead of TCP")
+
+    serve = commands.choices["serve"]
+    serve.add_argument("--model", help="model saved by SpamFilter.save; trained from data/training if omitted")
+    serve.add_argument("--max-batch", type=int, default=64)
+    serve.add_argument("--max-delay", type=float, default=0.005, help="seconds a request may wait for its batch")
+    serve.add_argument("--workers", type=int, default=None, help="worker processes (needs --model)")
+
+    bench = commands.choices["bench"]
+    bench.add_argument("--data", default=os.path.join(DATA_DIR, "testing"), help="directory of messages to replay")
+    bench.add_argument("--concurrency", type=int, default=16)
+    bench.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        model = None
+        if args.model is None:
+            model = SpamFilter(os.path.join(DATA_DIR, "training", "spam"), os.path.join(DATA_DIR, "training", "ham"), 1.0)
+
+        async def serve_forever():
+            service = SpamService(model, args.model, args.max_batch, args.max_delay, args.workers)
+            server = await service.start(args.host, args.port, args.unix)
+            print("Serving on %s" % (args.unix or "%s:%d" % (args.host, args.port)))
+            async with server:
+                await server.serve_forever()
+
+        asyncio.run(serve_forever())
+    else:
+        paths = [os.path.join(args.data, name) for name in sorted(os.listdir(args.data))]
+        result = asyncio.run(replay(paths, args.host, args.port, args.unix, args.concurrency, args.repeat))
+        del result["labels"]
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
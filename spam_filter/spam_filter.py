@@ -1,8 +1,27 @@
+import concurrent.futures
 import email
+import email.header
+import hashlib
+import heapq
+import json
+import mmap
+import re
+import struct
+import sys
+from abc import ABC, abstractmethod
+from array import array
 from collections import Counter
-from math import log, exp
+from functools import lru_cache, partial
+from itertools import repeat
+from math import log, log1p, exp
+from operator import mul
 import os
 
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, classify_many falls back to arrays without it
+    np = None
+
 """
 A minimal system for spam filtering made by processing the raw training data, 
 estimating the conditional probability distributions of the words in the vocabulary 
@@ -19,48 +38,677 @@ def load_tokens(email_path):
             tokens += line.split() # Splits the words by whitespace
     return tokens
         
-def log_probs(email_paths, smoothing):
-    """Calculate log probabilities of tokens from a list of emails with smoothing"""
-    # Time complexity: O(n)
+# A header line of the fast path: a field name, a colon, and the value
+HEADER_LINE = re.compile(rb"([!-9;-~]+)[ \t]*:(.*)")
+# Transfer encodings whose raw bytes are the text itself
+PLAIN_ENCODINGS = ("", "7bit", "8bit", "binary")
+
+class Tokenizer(object):
+    """
+    Turns emails into tokens. With the defaults it gives exactly the tokens of load_tokens:
+    the body split on whitespace, headers ignored, encoded parts left encoded.
+    lowercase: case-fold every token
+    headers:   header fields whose words become extra tokens prefixed with the lowercased field name,
+               e.g. "subject:free" for headers=("Subject",)
+    decode:    decode base64 and quoted-printable parts, use only the text parts of multipart
+               emails, and decode RFC 2047 encoded words in headers
+    Plain single-part emails are tokenized straight from their raw bytes without the email parser.
+    Token counts of up to `cache_size` files are cached by path and checked against the file's
+    modification time and size, so tokenizing the same corpus again is nearly free
+    """
+
+    def __init__(self, lowercase=False, headers=(), decode=False, cache_size=10000):
+        self.lowercase = lowercase
+        self.headers = tuple(headers)
+        self.decode = decode
+        self.cache_size = cache_size
+        self.cache = {}  # path -> ((mtime, size), Counter of tokens)
+
+    def spec(self):
+        """The settings as a JSON string, enough to rebuild the tokenizer with get_tokenizer(**json.loads(spec))"""
+        return json.dumps({"lowercase": self.lowercase, "headers": list(self.headers), "decode": self.decode})
+
+    def __getstate__(self):
+        # Worker processes get the settings but not the cache
+        state = self.__dict__.copy()
+        state["cache"] = {}
+        return state
+
+    def tokens(self, message):
+        """Extract tokens from the raw bytes of an email"""
+        # Time complexity: O(n)
+
+        fields, body = self._split(message)
+        if fields is None:
+            return self._parsed_tokens(message)
+
+        tokens = self._words(body.decode("utf-8", "surrogateescape"))
+        for name in self.headers:
+            value = fields.get(name.lower())
+            if value is not None:
+                tokens += self._header_tokens(name, value.decode("utf-8", "surrogateescape"))
+        return tokens
+
+    def _split(self, message):
+        """
+        Returns ({lowercased field name: raw value}, body) for a plain single-part email,
+        or (None, None) when the email needs the full parser
+        """
+        end = message.find(b"\n\n")
+        if end < 0 or b"\r" in message[:end]:
+            return None, None
+        lines = message[:end].split(b"\n")
+        if lines[0].startswith(b"From "):
+            del lines[0]  # mbox separator line, not a header
+
+        fields = {}
+        name = None  # Field that continuation lines extend, None while skipping a repeated field
+        for number, line in enumerate(lines):
+            if line[:1] in (b" ", b"\t") and number:
+                if name is not None:
+                    fields[name] += b" " + line.strip()  # Folded continuation of the field
+                continue
+            match = HEADER_LINE.match(line)
+            if match is None:
+                return None, None
+            name = match.group(1).decode("ascii").lower()
+            if name in fields:
+                name = None  # Only the first occurrence counts, like Message.get
+                continue
+            fields[name] = match.group(2).strip()
+
+        content_type = fields.get("content-type", b"text/plain").lower()
+        if content_type.startswith((b"multipart/", b"message/")):
+            return None, None
+        if self.decode and fields.get("content-transfer-encoding", b"").strip().lower().decode(
+                "ascii", "replace") not in PLAIN_ENCODINGS:
+            return None, None
+        return fields, message[end + 2:]
+
+    def _parsed_tokens(self, message):
+        """Tokens of an email that needs the full parser"""
+        if not self.decode:
+            parsed = email.message_from_string(message.decode("utf-8", "surrogateescape"))
+            tokens = []
+            for line in email.iterators.body_line_iterator(parsed):
+                tokens += self._words(line)
+        else:
+            parsed = email.message_from_bytes(message)
+            tokens = []
+            for part in parsed.walk():
+                if part.is_multipart() or part.get_content_maintype() != "text":
+                    continue
+                payload = part.get_payload(decode=True) or b""
+                try:
+                    text = payload.decode(part.get_content_charset() or "utf-8", "replace")
+                except LookupError:
+                    text = payload.decode("utf-8", "replace")
+                tokens += self._words(text)
+
+        for name in self.headers:
+            value = parsed.get(name)
+            if value is not None:
+                tokens += self._header_tokens(name, str(value))
+        return tokens
+
+    def _words(self, text):
+        return (text.casefold() if self.lowercase else text).split()
+
+    def _header_tokens(self, name, value):
+        if self.decode and "=?" in value:
+            try:
+                value = str(email.header.make_header(email.header.decode_header(value)))
+            except (email.errors.HeaderParseError, LookupError, UnicodeDecodeError):
+                pass
+        prefix = name.lower() + ":"
+        return [prefix + word for word in self._words(value)]
+
+    def file_counts(self, path):
+        """Token counts of the email file at `path`, from the cache while the file is unchanged"""
+        # Time complexity: O(n) on a cache miss, O(1) on a hit
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = self.cache.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with open(path, "rb") as f:
+            counts = Counter(self.tokens(f.read()))
+        self.store(path, stamp, counts)
+        return counts
+
+    def cached_counts(self, path):
+        """Token counts of `path` if they are cached and the file is unchanged, otherwise None"""
+        cached = self.cache.get(path)
+        if cached is None:
+            return None
+        stat = os.stat(path)
+        return cached[1] if cached[0] == (stat.st_mtime_ns, stat.st_size) else None
 
-    tokens = []
+    def store(self, path, stamp, counts):
+        """Cache the token counts of `path`, keeping at most cache_size files"""
+        if self.cache_size <= 0:
+            return
+        if path not in self.cache and len(self.cache) >= self.cache_size:
+            del self.cache[next(iter(self.cache))]  # Evict the oldest entry
+        self.cache[path] = (stamp, counts)
+
+@lru_cache(maxsize=None)
+def get_tokenizer(lowercase=False, headers=(), decode=False):
+    """Shared tokenizer for these settings, so its file cache is reused across models and runs"""
+    return Tokenizer(lowercase, tuple(headers), decode)
+
+def _item_counts(tokenizer, item):
+    """Worker: token counts of one email, given as a path or as the raw message bytes"""
+    if isinstance(item, (bytes, bytearray)):
+        return Counter(tokenizer.tokens(bytes(item)))
+    return tokenizer.file_counts(item)
+
+def _count_chunk(tokenizer, email_paths):
+    """Worker: token counts of each email of a chunk, as (path, (mtime, size), Counter) for the parent's cache"""
+    results = []
     for path in email_paths:
-        tokens += load_tokens(path)
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            results.append((path, (stat.st_mtime_ns, stat.st_size), Counter(tokenizer.tokens(f.read()))))
+    return results
+
+def count_tokens(email_paths, workers=None, chunk_size=64, tokenizer=None):
+    """
+    Count the tokens of many emails without ever holding all of their tokens at once
+    Each email is counted on its own and merged into a running total, so memory grows with the
+    vocabulary rather than the corpus. Emails already in the tokenizer's cache are not read again.
+    With `workers`, chunks of `chunk_size` emails are parsed and counted in a process pool and their
+    Counters merged as they come back. `tokenizer` defaults to get_tokenizer()
+    """
+    # Time complexity: O(n)
+
+    tokenizer = tokenizer or get_tokenizer()
+    email_paths = list(email_paths)
+    known = [tokenizer.cached_counts(path) for path in email_paths]
+    missing = [path for path, cached in zip(email_paths, known) if cached is None]
+
+    # Counts are merged in the order of email_paths whether or not they were cached,
+    # so words keep the order in which they first appear
+    counts = Counter()
+    if not workers or workers < 2 or not missing:
+        for path, cached in zip(email_paths, known):
+            counts.update(cached if cached is not None else tokenizer.file_counts(path))
+        return counts
+
+    chunks = (missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size))
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        results = (result for chunk in pool.map(partial(_count_chunk, tokenizer), chunks) for result in chunk)
+        for cached in known:
+            if cached is None:
+                path, stamp, cached = next(results)
+                tokenizer.store(path, stamp, cached)
+            counts.update(cached)
+    return counts
+
+def log_probs(email_paths, smoothing, workers=None, tokenizer=None):
+    """Calculate log probabilities of tokens from a list of emails with smoothing"""
+    # Time complexity: O(n)
 
-    vocab = set(tokens) # Ensures unique words
-    word_counts = Counter(tokens)
-    total_words = len(tokens)
-    denom = total_words + smoothing * (len(vocab) + 1) # Denominator for smoothing
+    word_counts = count_tokens(email_paths, workers, tokenizer=tokenizer)
+    total_words = sum(word_counts.values())
+    denom = total_words + smoothing * (len(word_counts) + 1) # Denominator for smoothing
 
     # Computes the log probabilities with smoothing
     probs = {word: log((count + smoothing) / denom) for word, count in word_counts.items()}
     probs["<UNK>"] = log(smoothing / denom)
     return probs
 
-class SpamFilter(object):
+def _softplus(z):
+    """log(1 + exp(z)) without overflow"""
+    return z + log1p(exp(-z)) if z > 0 else log1p(exp(z))
+
+def platt_scale(log_odds, labels, iterations=100):
+    """
+    Fit Platt scaling to the raw log-odds of held-out emails and their labels (true for spam)
+    Returns (scale, offset) maximizing the likelihood of P(spam) = 1 / (1 + exp(-(scale * log_odds + offset))),
+    with Platt's smoothed targets so that separable scores still give a finite scale.
+    Newton's method with a backtracking line search, as in Lin, Lin and Weng (2007)
+    """
+    # Time complexity: O(n × iterations)
+    # n is the number of emails
+
+    log_odds = [float(score) for score in log_odds]
+    positives = sum(1 for label in labels if label)
+    negatives = len(log_odds) - positives
+    if not positives or not negatives:
+        raise ValueError("calibration needs held-out emails of both classes")
+    high, low = (positives + 1.0) / (positives + 2.0), 1.0 / (negatives + 2.0)
+    targets = [high if label else low for label in labels]
+
+    def loss(scale, offset):
+        # Cross-entropy against the targets: log(1 + exp(z)) - t × z
+        return sum(_softplus(scale * score + offset) - target * (scale * score + offset)
+                   for score, target in zip(log_odds, targets))
+
+    scale, offset = 0.0, log((positives + 1.0) / (negatives + 1.0))
+    current = loss(scale, offset)
+    for _ in range(iterations):
+        # Gradient and Hessian of the loss in (scale, offset)
+        g_scale = g_offset = h_scale = h_cross = h_offset = 0.0
+        for score, target in zip(log_odds, targets):
+            z = scale * score + offset
+            p = 1.0 / (1.0 + exp(-z)) if z >= 0 else exp(z) / (1.0 + exp(z))
+            weight = p * (1.0 - p)
+            g_scale += (p - target) * score
+            g_offset += p - target
+            h_scale += weight * score * score
+            h_cross += weight * score
+            h_offset += weight
+        if abs(g_scale) < 1e-5 and abs(g_offset) < 1e-5:
+            break
+        h_scale += 1e-12
+        h_offset += 1e-12
+        det = h_scale * h_offset - h_cross * h_cross
+        step_scale = -(h_offset * g_scale - h_cross * g_offset) / det
+        step_offset = -(h_scale * g_offset - h_cross * g_scale) / det
+
+        # Halve the Newton step until the loss drops enough
+        step = 1.0
+        while step >= 1e-10:
+            new_scale, new_offset = scale + step * step_scale, offset + step * step_offset
+            new = loss(new_scale, new_offset)
+            if new < current + 1e-4 * step * (g_scale * step_scale + g_offset * step_offset):
+                scale, offset, current = new_scale, new_offset, new
+                break
+            step /= 2
+        else:
+            break
+    return scale, offset
+
+# Model files written by SpamFilter.save: a fixed header, then the log(count + smoothing) tables of spam
+# and ham as little-endian doubles, their raw counts and the order in which each class first counted every
+# word as little-endian int64 (all aligned with the vocabulary), the vocabulary as UTF-8, one word per line,
+# and finally the tokenizer settings as JSON
+MODEL_MAGIC = b"NBSF"
+MODEL_VERSION = 5
+MODEL_HEADER = "<4sHHQQQdQQQQQQdd"  # magic, version, flags, vocabulary size, vocabulary bytes, tokenizer bytes,
+                                    # smoothing, then messages, tokens and distinct words seen for spam, then for ham,
+                                    # then the calibration scale and offset
+
+LABELS = ("spam", "ham")
+
+class ClassCounts(object):
+    """
+    Raw token counts of one class, aligned with the filter's vocabulary, and what is needed to turn
+    them into smoothed log-probabilities:
+    log P(w | class) = log(count(w) + smoothing) - log(tokens + smoothing * (seen + 1))
+    The numerators log(count + smoothing) are stored per word and only change for the words whose
+    count changes; the shared denominator is recomputed from two totals whenever it is needed
+    """
+
+    def __init__(self, smoothing, counts=None, numerators=None, messages=0, tokens=0, seen=0, first=None):
+        self.smoothing = smoothing
+        self.counts = array("q") if counts is None else counts
+        self.numerators = array("d") if numerators is None else numerators
+        self.messages = messages  # Training emails of this class
+        self.tokens = tokens  # Tokens in those emails
+        self.seen = seen  # Distinct words with a nonzero count
+        # first[i] = how many words this class had counted before word i, -1 if it never counted it;
+        # None when the order is not tracked
+        self.first = first
+        self.sequence = 0 if first is None else sum(1 for position in first if position >= 0)
+
+    def grow(self, size):
+        """Extend the tables with zero counts up to `size` words"""
+        # Tables of a loaded model are read-only views of the model file, so copy them on first change
+        if not isinstance(self.counts, array):
+            self.counts = array("q", self.counts)
+            self.numerators = array("d", self.numerators)
+            if self.first is not None:
+                self.first = array("q", self.first)
+        missing = size - len(self.counts)
+        if missing > 0:
+            self.counts.extend(repeat(0, missing))
+            self.numerators.extend(repeat(log(self.smoothing), missing))
+            if self.first is not None:
+                self.first.extend(repeat(-1, missing))
 
-    def __init__(self, spam_dir, ham_dir, smoothing):
+    def add(self, i, count):
+        """Add `count` occurrences of word i, or remove them if `count` is negative"""
+        before = self.counts[i]
+        after = before + count
+        self.counts[i] = after
+        self.numerators[i] = log(after + self.smoothing)
+        self.tokens += count
+        self.seen += (after > 0) - (before > 0)
+        if self.first is not None and after > 0 and self.first[i] < 0:
+            self.first[i] = self.sequence
+            self.sequence += 1
+
+    def denominator(self):
+        return self.tokens + self.smoothing * (self.seen + 1)
+
+    def log_denominator(self):
+        return log(self.denominator())
+
+    def log_probs(self):
+        """
+        Smoothed log-probability of every vocabulary word, as an array aligned with the vocabulary,
+        computed as log((count + smoothing) / denominator) like log_probs() does
+        """
+        # Time complexity: O(v)
+        denom, smoothing = self.denominator(), self.smoothing
+        return array("d", [log((count + smoothing) / denom) for count in self.counts])
+
+    def order(self):
+        """Ids of the words this class has counted, in the order it first counted them"""
+        # Time complexity: O(v)
+        order = array("q", repeat(0, self.sequence))
+        for i, position in enumerate(self.first):
+            if position >= 0:
+                order[position] = i
+        return order
+
+class NaiveBayesFilter(ABC):
+    """
+    What the spam filters share: training from directories or path lists, the spam and ham ClassCounts
+    and class priors, tokenizing batches, and calibrating and packaging batch results.
+    Subclasses decide how words map to counters (`_setup`, `partial_fit`) and how emails are scored
+    (`is_spam`, `classify_many`)
+    """
+
+    def __init__(self, spam_dir, ham_dir, smoothing, workers=None, tokenizer=None, **options):
         """
         Train the spam filter using directories of spam and ham emails
-        Builds word probability dictionaries and computes prior class probabilities
+        Counts the words of each class, from which the word probabilities and class priors follow
+        With `workers`, the emails are parsed and counted in a process pool
+        `tokenizer` (a Tokenizer, get_tokenizer() by default) is used for training and classifying alike
         """
         # Time complexity: O(n)
 
-        self.smoothing = smoothing
+        self._setup(smoothing, tokenizer, **options)
 
         # Get full paths to spam and ham email files
         spam_paths = [os.path.join(spam_dir, f) for f in os.listdir(spam_dir)]
         ham_paths = [os.path.join(ham_dir, f) for f in os.listdir(ham_dir)]
 
-        # Calculate token log-probabilities for both spam and ham
-        self.spam_p_dict = log_probs(spam_paths, smoothing)
-        self.ham_p_dict = log_probs(ham_paths, smoothing)
+        self.partial_fit(spam_paths, "spam", workers)
+        self.partial_fit(ham_paths, "ham", workers)
+
+    @classmethod
+    def from_paths(cls, spam_paths, ham_paths, smoothing, workers=None, tokenizer=None, **options):
+        """
+        Train the spam filter from lists of spam and ham email paths rather than directories
+        """
+        # Time complexity: O(n)
+        model = cls.__new__(cls)
+        model._setup(smoothing, tokenizer, **options)
+        model.partial_fit(spam_paths, "spam", workers)
+        model.partial_fit(ham_paths, "ham", workers)
+        return model
+
+    def _setup(self, smoothing, tokenizer):
+        """Start an empty model; subclasses add their spam and ham ClassCounts"""
+        self.smoothing = smoothing
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.calibration = (1.0, 0.0)  # (scale, offset) applied to the log-odds, set by calibrate()
+
+    def _class_counts(self, label):
+        if label not in LABELS:
+            raise ValueError("label must be 'spam' or 'ham', not %r" % (label,))
+        return self.spam if label == "spam" else self.ham
+
+    @abstractmethod
+    def partial_fit(self, email_paths, label, workers=None):
+        """
+        Add emails of one class ("spam" or "ham") to the trained model
+        """
+
+    @abstractmethod
+    def is_spam(self, email_path):
+        """
+        Classify one email file as spam (True) or ham (False)
+        """
+
+    @abstractmethod
+    def classify_many(self, emails, workers=None):
+        """
+        Classify a batch of emails, each given as a path or as the raw bytes of the message
+        Returns (labels, log_odds): True for spam, and the calibrated log-odds of spam
+        """
+
+    @property
+    def spam_prob(self):
+        """Prior probability of spam: the share of training emails that were spam"""
+        return self.spam.messages / (self.spam.messages + self.ham.messages)
+
+    @property
+    def ham_prob(self):
+        """Prior probability of ham"""
+        return self.ham.messages / (self.spam.messages + self.ham.messages)
+
+    def _documents(self, emails, workers=None):
+        """Token counts of each email, given as a path or raw bytes, tokenized in a process pool with `workers`"""
+        if workers and workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                return list(pool.map(partial(_item_counts, self.tokenizer), emails, chunksize=16))
+        return map(partial(_item_counts, self.tokenizer), emails)
+
+    def calibrate(self, spam_paths, ham_paths, workers=None):
+        """
+        Fit the calibration of classify_many's log-odds to held-out spam and ham emails, which should not
+        have been trained on, by Platt scaling (see platt_scale). Returns the new (scale, offset).
+        The calibration stays as it is when the model is updated later; call this again to refit it
+        """
+        # Time complexity: O(n)
+        spam_paths, ham_paths = list(spam_paths), list(ham_paths)
+        self.calibration = (1.0, 0.0)
+        _, log_odds = self.classify_many(spam_paths + ham_paths, workers)
+        self.calibration = platt_scale(log_odds, [True] * len(spam_paths) + [False] * len(ham_paths))
+        return self.calibration
+
+    def _labelled(self, log_odds):
+        """
+        (labels, log_odds) for an array of raw log-odds, as NumPy arrays when NumPy is installed.
+        Labels are the naive Bayes decision, the same as is_spam's; the log-odds are calibrated
+        """
+        scale, offset = self.calibration
+        if np is not None:
+            log_odds = np.asarray(log_odds)
+            return log_odds > 0, log_odds * scale + offset
+        return (array("b", [score > 0 for score in log_odds]),
+                array("d", [score * scale + offset for score in log_odds]))
+
+    def memory_bytes(self):
+        """Approximate memory held by the count tables"""
+        total = 0
+        for class_counts in (self.spam, self.ham):
+            for table in (class_counts.counts, class_counts.numerators, class_counts.first):
+                if table is not None:
+                    total += memoryview(table).nbytes
+        return total
+
+class SpamFilter(NaiveBayesFilter):
+    """
+    Naive Bayes spam filter over an explicit vocabulary
+
+    SpamFilter(spam_dir, ham_dir, smoothing, workers=None, tokenizer=None)
+    """
+
+    def _setup(self, smoothing, tokenizer):
+        """Start an empty model"""
+        super()._setup(smoothing, tokenizer)
+        self.words = []  # The vocabulary, in order of first appearance
+        self.index = {}  # Word -> position in the vocabulary
+        self.spam = ClassCounts(smoothing, first=array("q"))
+        self.ham = ClassCounts(smoothing, first=array("q"))
+        self._weights = None  # Cached by weights(), dropped whenever the counts change
+        self._indicative = None  # Cached by indicative_scores(), likewise
+        self._p_dicts = None  # Cached by spam_p_dict and ham_p_dict, likewise
+
+    def partial_fit(self, email_paths, label, workers=None):
+        """
+        Add emails of one class ("spam" or "ham") to the trained model
+        Only the counts of their words and the class totals change, so the cost grows with these
+        emails rather than the whole corpus; probabilities and priors follow from the new counts
+        """
+        # Time complexity: O(n)
+        # n is the number of tokens in the new emails
+
+        target = self._class_counts(label)
+        email_paths = list(email_paths)
+        word_counts = count_tokens(email_paths, workers, tokenizer=self.tokenizer)
+
+        # New words join the end of the vocabulary with a zero count in both classes
+        index, words = self.index, self.words
+        for word in word_counts:
+            if word not in index:
+                index[word] = len(words)
+                words.append(word)
+        self.spam.grow(len(words))
+        self.ham.grow(len(words))
+
+        for word, count in word_counts.items():
+            target.add(index[word], count)
+        target.messages += len(email_paths)
+        self._weights = self._indicative = self._p_dicts = None
+
+    def forget(self, email_paths, label, workers=None):
+        """
+        Remove emails that were trained as `label` from the model, undoing their partial_fit
+        Words whose count drops to zero stay in the vocabulary but count as unseen
+        """
+        # Time complexity: O(n)
+        # n is the number of tokens in the forgotten emails
+
+        target = self._class_counts(label)
+        email_paths = list(email_paths)
+        word_counts = count_tokens(email_paths, workers, tokenizer=self.tokenizer)
+
+        index = self.index
+        if len(email_paths) > target.messages or any(
+                word not in index or target.counts[index[word]] < count for word, count in word_counts.items()):
+            raise ValueError("these emails were not all trained as %s" % label)
+
+        target.grow(len(self.words))
+        for word, count in word_counts.items():
+            target.add(index[word], -count)
+        target.messages -= len(email_paths)
+        self._weights = self._indicative = self._p_dicts = None
+
+    @property
+    def spam_unk(self):
+        """Log-probability of a word never seen in spam"""
+        return log(self.smoothing / self.spam.denominator())
+
+    @property
+    def ham_unk(self):
+        """Log-probability of a word never seen in ham"""
+        return log(self.smoothing / self.ham.denominator())
+
+    @property
+    def spam_log(self):
+        """Log-probabilities of every vocabulary word given spam, recomputed from the current counts"""
+        return self.spam.log_probs()
+
+    @property
+    def ham_log(self):
+        """Log-probabilities of every vocabulary word given ham, recomputed from the current counts"""
+        return self.ham.log_probs()
+
+    @property
+    def spam_p_dict(self):
+        """Log-probabilities of the words seen in spam, keyed by word, plus <UNK>; built once per model update"""
+        return self._probability_dicts()[0]
+
+    @property
+    def ham_p_dict(self):
+        """Log-probabilities of the words seen in ham, keyed by word, plus <UNK>; built once per model update"""
+        return self._probability_dicts()[1]
+
+    def _probability_dicts(self):
+        # Time complexity: O(v) the first time after a change, after that O(1)
+        if self._p_dicts is None:
+            self._p_dicts = (self._p_dict(self.spam, self.spam_unk), self._p_dict(self.ham, self.ham_unk))
+        return self._p_dicts
+
+    def _p_dict(self, class_counts, unk):
+        # Words in the order the class first saw them, as when the dicts were built from its emails
+        words, counts, probs = self.words, class_counts.counts, class_counts.log_probs()
+        p_dict = {words[i]: probs[i] for i in class_counts.order() if counts[i] > 0}
+        p_dict["<UNK>"] = unk
+        return p_dict
+
+    def save(self, path):
+        """
+        Write the model to `path` in the compact binary format read by load(), replacing it atomically
+        """
+        # Time complexity: O(v)
+
+        vocabulary = "\n".join(self.words).encode("utf-8", "surrogateescape")
+        tokenizer = self.tokenizer.spec().encode("utf-8")
+        header = struct.pack(MODEL_HEADER, MODEL_MAGIC, MODEL_VERSION, 0, len(self.words), len(vocabulary),
+                             len(tokenizer), self.smoothing, self.spam.messages, self.spam.tokens, self.spam.seen,
+                             self.ham.messages, self.ham.tokens, self.ham.seen, *self.calibration)
+
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, "wb") as f:
+            f.write(header)
+            for typecode, table in (("d", self.spam.numerators), ("d", self.ham.numerators),
+                                    ("q", self.spam.counts), ("q", self.ham.counts),
+                                    ("q", self.spam.first), ("q", self.ham.first)):
+                table = array(typecode, table)
+                if sys.byteorder == "big":
+                    table.byteswap()
+                f.write(table.tobytes())
+            f.write(vocabulary)
+            f.write(tokenizer)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a model written by save() without retraining
+        The tables stay in a read-only memory map, so processes loading the same file share those
+        pages; only the vocabulary index is built per process. The model can still be updated,
+        which copies the tables first
+        """
+        # Time complexity: O(v)
+
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header_size = struct.calcsize(MODEL_HEADER)
+        (magic, version, _, size, vocabulary_bytes, tokenizer_bytes, smoothing,
+         spam_messages, spam_tokens, spam_seen, ham_messages, ham_tokens, ham_seen,
+         scale, offset) = struct.unpack_from(MODEL_HEADER, data, 0)
+        if magic != MODEL_MAGIC or version != MODEL_VERSION:
+            raise ValueError("%s is not a version %d spam filter model" % (path, MODEL_VERSION))
+        if len(data) != header_size + 48 * size + vocabulary_bytes + tokenizer_bytes:
+            raise ValueError("%s is truncated or corrupt" % path)
+
+        tables = []
+        for number, typecode in enumerate("ddqqqq"):
+            start = header_size + 8 * size * number
+            table = memoryview(data)[start:start + 8 * size]
+            if sys.byteorder == "big":
+                table = array(typecode, table.tobytes())
+                table.byteswap()
+            else:
+                table = table.cast(typecode)
+            tables.append(table)
+
+        model = cls.__new__(cls)
+        model.smoothing = smoothing
+        model.calibration = (scale, offset)
+        model.spam = ClassCounts(smoothing, tables[2], tables[0], spam_messages, spam_tokens, spam_seen, tables[4])
+        model.ham = ClassCounts(smoothing, tables[3], tables[1], ham_messages, ham_tokens, ham_seen, tables[5])
+
+        start = header_size + 48 * size
+        vocabulary = data[start:start + vocabulary_bytes].decode("utf-8", "surrogateescape")
+        model.words = vocabulary.split("\n") if size else []
+        model.index = dict(zip(model.words, range(size)))
+        model._weights = model._indicative = model._p_dicts = None
+
+        settings = json.loads(data[start + vocabulary_bytes:].decode("utf-8"))
+        model.tokenizer = get_tokenizer(settings["lowercase"], tuple(settings["headers"]), settings["decode"])
+        return model
 
-        # Compute class priors based on number of training examples
-        total = len(spam_paths) + len(ham_paths)
-        self.spam_prob = len(spam_paths) / total
-        self.ham_prob = len(ham_paths) / total
-    
     def is_spam(self, email_path):
         """
         Classify an email as spam or ham based on learned probabilities
@@ -68,51 +716,275 @@ class SpamFilter(object):
         """
         # Time complexity: O(n)
 
-        tokens = load_tokens(email_path)
-        token_counts = Counter(tokens)
+        token_counts = self.tokenizer.file_counts(email_path)
 
         # Start with the log prior probabilities
         spam_score = log(self.spam_prob)
         ham_score = log(self.ham_prob)
 
         # Add log-probability of each word in the message
+        index, spam_numerators, ham_numerators = self.index, self.spam.numerators, self.ham.numerators
+        spam_denom, ham_denom = self.spam.log_denominator(), self.ham.log_denominator()
+        spam_unk, ham_unk = self.spam_unk, self.ham_unk
         for word, count in token_counts.items():
-            spam_score += self.spam_p_dict.get(word, self.spam_p_dict["<UNK>"]) * count
-            ham_score += self.ham_p_dict.get(word, self.ham_p_dict["<UNK>"]) * count
+            i = index.get(word)
+            if i is None:
+                spam_score += spam_unk * count
+                ham_score += ham_unk * count
+            else:
+                spam_score += (spam_numerators[i] - spam_denom) * count
+                ham_score += (ham_numerators[i] - ham_denom) * count
 
         # If the spam score is higher, classify as spam
         return spam_score > ham_score
 
+    def weights(self):
+        """
+        Return (bias, unknown_weight, weights): the terms of the linear form of the classifier.
+        The log-odds of spam for an email are bias + sum(count(w) * weights[w]) over its known words
+        plus unknown_weight for each unknown token, where weights[w] = log P(w|spam) - log P(w|ham)
+        is aligned with the vocabulary and bias = log P(spam) - log P(ham).
+        Computed once and reused until the model changes
+        """
+        # Time complexity: O(v)
+
+        if self._weights is None:
+            shift = self.ham.log_denominator() - self.spam.log_denominator()
+            weights = array("d", [spam - ham + shift for spam, ham in zip(self.spam.numerators, self.ham.numerators)])
+            self._weights = (log(self.spam_prob) - log(self.ham_prob), self.spam_unk - self.ham_unk, weights)
+        return self._weights
+
+    def memory_bytes(self):
+        """Approximate memory held by the model: vocabulary strings and index, and the count tables"""
+        return (super().memory_bytes() + sys.getsizeof(self.words) + sys.getsizeof(self.index)
+                + sum(map(sys.getsizeof, self.words)))
+
+    def classify_many(self, emails, workers=None):
+        """
+        Classify a batch of emails, each given as a path or as the raw bytes of the message
+        Returns (labels, log_odds): True for spam, as is_spam decides, and the log-odds of spam,
+        as NumPy arrays when NumPy is installed, otherwise as arrays.
+        The raw naive Bayes log-odds are far more extreme than the true odds, because of the independence
+        assumption, so they go through the Platt scaling fitted by calibrate() (or evaluation.calibration)
+        before they are returned; until then the scaling is the identity and they are the raw scores.
+        With NumPy the batch is scored with one sparse matrix-vector product; without it each email's
+        weights are summed in Python, which is no faster than calling is_spam on each.
+        With `workers`, the emails are tokenized in a process pool
+        """
+        # Time complexity: O(v + n)
+        # n is the total number of tokens in the batch
+
+        emails = list(emails)
+        documents = self._documents(emails, workers)
+
+        # One row per email in compressed sparse row form: the vocabulary ids and counts of its known
+        # words lie between offsets[row] and offsets[row + 1]; unknown tokens are only counted
+        index = self.index
+        ids, counts, unknown, offsets = array("q"), array("d"), array("d"), array("q", [0])
+        for document in documents:
+            missing = 0
+            for word, count in document.items():
+                i = index.get(word)
+                if i is None:
+                    missing += count
+                else:
+                    ids.append(i)
+                    counts.append(count)
+            unknown.append(missing)
+            offsets.append(len(ids))
+
+        # Sparse matrix-vector product of the rows with the weight vector, one row at a time without NumPy
+        bias, unknown_weight, weights = self.weights()
+        if np is not None:
+            rows = np.repeat(np.arange(len(emails)), np.diff(np.frombuffer(offsets, dtype=np.int64)))
+            products = np.asarray(weights)[np.frombuffer(ids, dtype=np.int64)] * np.frombuffer(counts)
+            return self._labelled(np.bincount(rows, weights=products, minlength=len(emails))
+                                  + np.frombuffer(unknown) * unknown_weight + bias)
+
+        row_weights = weights.__getitem__
+        return self._labelled(array("d", [bias + unknown[row] * unknown_weight
+                                          + sum(map(mul, map(row_weights, ids[offsets[row]:offsets[row + 1]]),
+                                                    counts[offsets[row]:offsets[row + 1]]))
+                                          for row in range(len(emails))]))
+
+    def indicative_scores(self):
+        """
+        Return (spam_scores, ham_scores, spam_ranked, ham_ranked): log(P(w|spam) / P(w)) and log(P(w|ham) / P(w))
+        for every word, aligned with the vocabulary plus a last entry for <UNK>, and the ids ranked for each
+        class: the words seen in both classes and then <UNK>, in the order that class first saw them, which
+        settles ties. Computed once and reused until the model changes
+        """
+        # Time complexity: O(v)
+
+        if self._indicative is None:
+            unknown = len(self.words)  # Id of <UNK> in the score arrays
+            spam_log, ham_log = self.spam_log, self.ham_log
+            spam_log.append(self.spam_unk)
+            ham_log.append(self.ham_unk)
+            spam_prob, ham_prob = self.spam_prob, self.ham_prob
+
+            spam_scores, ham_scores = array("d"), array("d")
+            for spam_p, ham_p in zip(spam_log, ham_log):
+                # P(w) = P(w|spam) * P(spam) + P(w|ham) * P(ham)
+                pw = exp(spam_p) * spam_prob + exp(ham_p) * ham_prob
+                spam_scores.append(log(exp(spam_p) / pw))
+                ham_scores.append(log(exp(ham_p) / pw))
+
+            spam_counts, ham_counts = self.spam.counts, self.ham.counts
+            spam_ranked, ham_ranked = (array("q", [i for i in class_counts.order() if spam_counts[i] and ham_counts[i]]
+                                             + [unknown]) for class_counts in (self.spam, self.ham))
+            self._indicative = (spam_scores, ham_scores, spam_ranked, ham_ranked)
+        return self._indicative
+
+    def _top(self, scores, ranked, n):
+        """The n entries of `ranked` with the highest scores, best first, ties in the order of `ranked`"""
+        # Time complexity: O(s log n)
+        # s is the number of words seen in both classes
+        if n <= 0:
+            return []
+        words, unknown = self.words, len(self.words)  # The id past the vocabulary is <UNK>
+        if np is not None and n < len(ranked):
+            candidates = np.frombuffer(ranked, dtype=np.int64)
+            values = np.asarray(scores)[candidates]
+            # Keep every candidate tied with the n-th best so ties are settled by position, not by argpartition
+            kth = -np.partition(-values, n - 1)[n - 1]
+            top = np.flatnonzero(values >= kth)
+            top = [int(candidates[i]) for i in top[np.lexsort((top, -values[top]))][:n]]
+        else:
+            top = heapq.nlargest(n, ranked, key=scores.__getitem__)
+        return [words[i] if i != unknown else "<UNK>" for i in top]
+
+    def most_indicative(self, n):
+        """
+        Return (spam words, ham words): the n words most indicative of each class
+        """
+        # Time complexity: O(v + s log n) the first time, after that O(s log n)
+        spam_scores, ham_scores, spam_ranked, ham_ranked = self.indicative_scores()
+        return self._top(spam_scores, spam_ranked, n), self._top(ham_scores, ham_ranked, n)
+
     def most_indicative_spam(self, n):
         """
         Return the n words most indicative of spam
         Computes indication using log(P(w|spam) / P(w))
         """
-        # Time compexity: O(v log n)
-        # v is the size of the vocabulary
-         
-        indicative = {}
-        for word in self.spam_p_dict:
-            if word in self.ham_p_dict:
-                # P(w) = P(w|spam) * P(spam) + P(w|ham) * P(ham)
-                pw = (exp(self.spam_p_dict[word]) * self.spam_prob +
-                      exp(self.ham_p_dict[word]) * self.ham_prob)
-                indicative[word] = log(exp(self.spam_p_dict[word]) / pw)
-        return sorted(indicative, key=indicative.get, reverse=True)[:n]
+        # Time complexity: O(v + s log n) the first time, after that O(s log n)
+        spam_scores, _, spam_ranked, _ = self.indicative_scores()
+        return self._top(spam_scores, spam_ranked, n)
 
     def most_indicative_ham(self, n):
         """
         Return the n words most indicative of ham
         Computes indication using log(P(w|ham) / P(w))
         """
-        # Time compexity: O(v log n)
-        # v is the size of the vocabulary
-        
-        indicative = {}
-        for word in self.ham_p_dict:
-            if word in self.spam_p_dict:
-                # P(w) = P(w|spam) * P(spam) + P(w|ham) * P(ham)
-                pw = (exp(self.spam_p_dict[word]) * self.spam_prob +
-                      exp(self.ham_p_dict[word]) * self.ham_prob)
-                indicative[word] = log(exp(self.ham_p_dict[word]) / pw)
-        return sorted(indicative, key=indicative.get, reverse=True)[:n]
\ No newline at end of file
+        # Time complexity: O(v + s log n) the first time, after that O(s log n)
+        _, ham_scores, _, ham_ranked = self.indicative_scores()
+        return self._top(ham_scores, ham_ranked, n)
+
+class HashedSpamFilter(NaiveBayesFilter):
+    """
+    Spam filter with a fixed memory footprint whatever the size of the corpus: instead of a vocabulary,
+    words are hashed into `depth` rows of `width` counters per class.
+    With depth 1 this is the hashing trick, where colliding words share one count.
+    With a larger depth it is a count-min sketch: a word's count is the smallest of its counters, one
+    per row, and additions use conservative update (raising only the counters below the new estimate),
+    which keeps estimates close to exact. A sketch cannot remove counts, so forget() needs depth 1.
+    The number of distinct words in a class, used in the smoothing denominator, is estimated by the
+    occupied counters of the first row.
+    No vocabulary is kept, so there are no per-word probabilities, rankings or model files.
+
+    HashedSpamFilter(spam_dir, ham_dir, smoothing, width=1 << 18, depth=1, workers=None, tokenizer=None)
+    """
+
+    def _setup(self, smoothing, tokenizer, width=1 << 18, depth=1):
+        super()._setup(smoothing, tokenizer)
+        self.width = width
+        self.depth = depth
+        self.spam = ClassCounts(smoothing)
+        self.ham = ClassCounts(smoothing)
+        self.spam.grow(width * depth)
+        self.ham.grow(width * depth)
+
+    def slots(self, word):
+        """The counter of `word` in each row, as positions in the flat tables"""
+        # Double hashing: row r uses h1 + r * h2, all from one 128-bit digest
+        digest = hashlib.blake2b(word.encode("utf-8", "surrogateescape"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def _add(self, target, word, count):
+        slots = self.slots(word)
+        if self.depth == 1:
+            target.add(slots[0], count)
+            return
+
+        # Conservative update: raise each counter only as far as the word's new estimate
+        counts, numerators = target.counts, target.numerators
+        estimate = min(counts[slot] for slot in slots) + count
+        if counts[slots[0]] == 0:
+            target.seen += 1
+        for slot in slots:
+            if counts[slot] < estimate:
+                counts[slot] = estimate
+                numerators[slot] = log(estimate + self.smoothing)
+        target.tokens += count
+
+    def partial_fit(self, email_paths, label, workers=None):
+        """
+        Add emails of one class ("spam" or "ham") to the trained model
+        """
+        # Time complexity: O(n)
+        target = self._class_counts(label)
+        email_paths = list(email_paths)
+        for word, count in count_tokens(email_paths, workers, tokenizer=self.tokenizer).items():
+            self._add(target, word, count)
+        target.messages += len(email_paths)
+
+    def forget(self, email_paths, label, workers=None):
+        """
+        Remove emails that were trained as `label`; only possible with depth 1
+        """
+        # Time complexity: O(n)
+        if self.depth != 1:
+            raise ValueError("a count-min sketch cannot forget counts, use depth=1")
+        target = self._class_counts(label)
+        email_paths = list(email_paths)
+        word_counts = count_tokens(email_paths, workers, tokenizer=self.tokenizer)
+        slots = {word: self.slots(word)[0] for word in word_counts}
+        removed = Counter()
+        for word, count in word_counts.items():
+            removed[slots[word]] += count
+        if len(email_paths) > target.messages or any(target.counts[slot] < count for slot, count in removed.items()):
+            raise ValueError("these emails were not all trained as %s" % label)
+
+        for slot, count in removed.items():
+            target.add(slot, -count)
+        target.messages -= len(email_paths)
+
+    def log_odds(self, token_counts):
+        """Log-odds of spam for an email given as a Counter of its tokens"""
+        # Time complexity: O(n)
+        spam_numerators, ham_numerators = self.spam.numerators, self.ham.numerators
+        score = log(self.spam_prob) - log(self.ham_prob)
+        shift = self.ham.log_denominator() - self.spam.log_denominator()
+        for word, count in token_counts.items():
+            slots = self.slots(word)
+            # log is increasing, so the smallest numerator belongs to the smallest count
+            score += count * (min(spam_numerators[slot] for slot in slots)
+                              - min(ham_numerators[slot] for slot in slots) + shift)
+        return score
+
+    def is_spam(self, email_path):
+        """
+        Classify an email as spam or ham based on the hashed counts
+        """
+        # Time complexity: O(n)
+        return self.log_odds(self.tokenizer.file_counts(email_path)) > 0
+
+    def classify_many(self, emails, workers=None):
+        """
+        Classify a batch of emails, each given as a path or as the raw bytes of the message
+        Returns (labels, log_odds) like SpamFilter.classify_many
+        """
+        # Time complexity: O(n)
+        return self._labelled(array("d", map(self.log_odds, self._documents(list(emails), workers))))
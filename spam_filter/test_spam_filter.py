@@ -1,5 +1,10 @@
+import asyncio
 import os
-from spam_filter import SpamFilter
+import tempfile
+from spam_filter import HashedSpamFilter, SpamFilter, Tokenizer, load_tokens
+from array import array
+from evaluation import Corpus, calibration, cross_validate, fold_log_odds, make_folds, results_table
+from service import SpamService, replay
 
 spam_dir = "data/training/spam"
 ham_dir = "data/training/ham"
@@ -11,15 +16,161 @@ filter = SpamFilter(spam_dir, ham_dir, smoothing=1.0)
 test_dir = "data/testing" 
 test_emails = [os.path.join(test_dir, f) for f in os.listdir(test_dir)]
 
-# Classify each test email and print result
+# Classify all test emails in one batch and print result
 print("Test Email Classifications:\n")
-for path in test_emails:
-    label = "SPAM" if filter.is_spam(path) else "HAM"
+labels, log_odds = filter.classify_many(test_emails)
+for path, is_spam in zip(test_emails, labels):
+    label = "SPAM" if is_spam else "HAM"
     print(f"{os.path.basename(path)} => {label}")
 
-# Bonus: show the most indicative words
+# The batch agrees with classifying the emails one at a time
+agree = sum(bool(is_spam) == filter.is_spam(path) for path, is_spam in zip(test_emails, labels))
+print(f"\nBatch and single classification agree on {agree}/{len(test_emails)} test emails")
+assert agree == len(test_emails)
+
+# Bonus: show the most indicative words of both classes
+spam_words, ham_words = filter.most_indicative(10)
 print("\nMost Indicative Spam Words:")
-print(filter.most_indicative_spam(10))
+print(spam_words)
 
 print("\nMost Indicative Ham Words:")
-print(filter.most_indicative_ham(10))
\ No newline at end of file
+print(ham_words)
+
+# Save the model, load it back without retraining and check it classifies the same way
+with tempfile.TemporaryDirectory() as model_dir:
+    model_path = os.path.join(model_dir, "model.bin")
+    filter.save(model_path)
+    loaded = SpamFilter.load(model_path)
+    agree = sum(loaded.is_spam(path) == filter.is_spam(path) for path in test_emails)
+    print(f"\nReloaded model agrees on {agree}/{len(test_emails)} test emails")
+    assert agree == len(test_emails)
+    assert loaded.most_indicative(10) == (spam_words, ham_words)
+
+# Train again with the emails parsed in a process pool; the model should come out the same
+parallel = SpamFilter(spam_dir, ham_dir, smoothing=1.0, workers=2)
+same = parallel.spam_p_dict == filter.spam_p_dict and parallel.ham_p_dict == filter.ham_p_dict
+print(f"Parallel training gives the same model: {same}")
+assert same
+
+# Forget part of the spam training set, then add it back; the model should return to where it was
+spam_paths = sorted(os.path.join(spam_dir, f) for f in os.listdir(spam_dir))[:100]
+filter.forget(spam_paths, "spam")
+print(f"Spam prior without {len(spam_paths)} spam emails: {filter.spam_prob:.3f}")
+filter.partial_fit(spam_paths, "spam")
+restored = filter.spam_p_dict == parallel.spam_p_dict and filter.spam_prob == parallel.spam_prob
+print(f"Spam prior after adding them back: {filter.spam_prob:.3f}, model restored: {restored}")
+assert restored
+
+# The default tokenizer gives exactly the tokens of load_tokens, on every email of the corpus
+default_tokenizer = Tokenizer(cache_size=0)
+all_emails = [os.path.join(directory, f) for directory in (spam_dir, ham_dir, test_dir) for f in os.listdir(directory)]
+for path in all_emails:
+    with open(path, "rb") as f:
+        assert default_tokenizer.tokens(f.read()) == load_tokens(path), path
+print(f"\nDefault tokenizer matches load_tokens on all {len(all_emails)} emails")
+
+# Header prefixes, case folding and decoding on a small multipart message
+message = (b"From: Shop <deals@example.com>\n"
+           b"Subject: =?utf-8?q?FREE_Money?=\n"
+           b"MIME-Version: 1.0\n"
+           b"Content-Type: multipart/alternative; boundary=\"b\"\n"
+           b"\n"
+           b"--b\n"
+           b"Content-Type: text/plain; charset=utf-8\n"
+           b"Content-Transfer-Encoding: base64\n"
+           b"\n"
+           b"Q2xpY2sgSGVyZSBub3c=\n"
+           b"--b\n"
+           b"Content-Type: image/png\n"
+           b"Content-Transfer-Encoding: base64\n"
+           b"\n"
+           b"iVBORw0KGgo=\n"
+           b"--b--\n")
+tokens = Tokenizer(lowercase=True, headers=("Subject", "From"), decode=True).tokens(message)
+assert tokens == ["click", "here", "now", "subject:free", "subject:money",
+                  "from:shop", "from:<deals@example.com>"], tokens
+plain = Tokenizer().tokens(b"Subject: Hello World\n\nBuy NOW\n")
+assert plain == ["Buy", "NOW"], plain
+assert Tokenizer(headers=("Subject",)).tokens(b"Subject: Hello World\n\nBuy NOW\n") == [
+    "Buy", "NOW", "subject:Hello", "subject:World"]
+print("Tokenizer options give the expected tokens")
+
+# A case-folded model that also learns from the Subject and From headers and decodes encoded parts
+tokenizer = Tokenizer(lowercase=True, headers=("Subject", "From"), decode=True)
+header_filter = SpamFilter(spam_dir, ham_dir, smoothing=1.0, tokenizer=tokenizer)
+header_labels, _ = header_filter.classify_many(test_emails)
+agree = sum(bool(a) == bool(b) for a, b in zip(header_labels, labels))
+print(f"\nHeader-aware model agrees with the default one on {agree}/{len(test_emails)} test emails")
+print(header_filter.most_indicative_spam(10))
+
+# Hashed models keep fixed-size count tables instead of a vocabulary
+for width, depth in ((1 << 16, 1), (1 << 16, 4)):
+    hashed = HashedSpamFilter(spam_dir, ham_dir, smoothing=1.0, width=width, depth=depth)
+    hashed_labels, _ = hashed.classify_many(test_emails)
+    agree = sum(bool(a) == bool(b) for a, b in zip(hashed_labels, labels))
+    consistent = all(hashed.is_spam(path) == bool(label) for path, label in zip(test_emails[:50], hashed_labels))
+    print(f"Hashed {width}x{depth}: {hashed.memory_bytes() / 1048576:.1f} MB against "
+          f"{filter.memory_bytes() / 1048576:.1f} MB, agrees on {agree}/{len(test_emails)} test emails, "
+          f"is_spam consistent: {consistent}")
+
+# Tokenize the training set once, then cross-validate a few smoothing values on it
+corpus = Corpus.from_dirs(spam_dir, ham_dir)
+print("\n5-fold cross-validation:")
+results = cross_validate(corpus, [0.1, 1.0], k=5, workers=2)
+print(results_table(results))
+assert all(0 <= result["auc"] <= 1 and 0 <= result["accuracy"] <= 1 for result in results)
+try:
+    make_folds(corpus, 1)
+except ValueError:
+    pass
+else:
+    raise AssertionError("a single fold leaves no training data and must be rejected")
+
+# Platt scaling fitted to the out-of-fold scores shrinks the overconfident raw log-odds, keeps the labels,
+# and is saved with the model
+calibrated_filter = SpamFilter(spam_dir, ham_dir, smoothing=1.0)
+calibrated_filter.calibration = calibration(corpus, 1.0, k=5)
+scale, offset = calibrated_filter.calibration
+calibrated_labels, calibrated = calibrated_filter.classify_many(test_emails)
+assert 0 < scale < 1, scale
+assert [bool(label) for label in calibrated_labels] == [bool(label) for label in labels]
+assert all(abs(raw * scale + offset - score) < 1e-9 for raw, score in zip(log_odds, calibrated))
+with tempfile.TemporaryDirectory() as model_dir:
+    model_path = os.path.join(model_dir, "model.bin")
+    calibrated_filter.save(model_path)
+    assert SpamFilter.load(model_path).calibration == (scale, offset)
+print(f"Calibration: scale {scale:.4f}, offset {offset:.2f}, log-odds within "
+      f"±{max(map(abs, log_odds)):.0f} raw and ±{max(map(abs, calibrated)):.0f} calibrated")
+
+# Scores from subtracting a fold's counts match a model trained from scratch on the other folds
+fold = make_folds(corpus, 5)[0]
+corpus_paths = ([os.path.join(spam_dir, f) for f in sorted(os.listdir(spam_dir))]
+                + [os.path.join(ham_dir, f) for f in sorted(os.listdir(ham_dir))])
+held_out = set(fold.members)
+training = [i for i in range(len(corpus)) if i not in held_out]
+retrained = SpamFilter.from_paths([corpus_paths[i] for i in training if corpus.labels[i]],
+                                  [corpus_paths[i] for i in training if not corpus.labels[i]], 1.0)
+fold_scores = array("d", bytes(8 * len(corpus)))
+fold_log_odds(corpus, fold, 1.0, fold_scores)
+_, retrained_scores = retrained.classify_many([corpus_paths[i] for i in fold.members])
+worst = max(abs(fold_scores[i] - score) for i, score in zip(fold.members, retrained_scores))
+assert worst < 1e-6, worst
+print(f"Fold scores match a retrained model to within {worst:.1e}")
+
+# Serve the model over a Unix socket and replay the test emails against it from 16 connections
+async def serve_and_replay(socket_path):
+    service = SpamService(filter, max_batch=32, max_delay=0.005)
+    await service.start(unix_path=socket_path)
+    try:
+        return await replay(test_emails, unix_path=socket_path, concurrency=16)
+    finally:
+        await service.close()
+
+with tempfile.TemporaryDirectory() as socket_dir:
+    result = asyncio.run(serve_and_replay(os.path.join(socket_dir, "spam_filter.sock")))
+agree = sum(bool(a) == bool(b) for a, b in zip(result["labels"], labels))
+print(f"\nService: {result['throughput']:.0f} emails/s, p50 {result['p50_ms']:.1f} ms, "
+      f"p99 {result['p99_ms']:.1f} ms, mean batch {result['server']['mean_batch']:.1f}, "
+      f"agrees on {agree}/{len(test_emails)} test emails")
+assert agree == len(test_emails)
+assert result["server"]["requests"] == len(test_emails)
@@ -0,0 +1,168 @@
+import concurrent.futures
+import os
+import time
+from collections import namedtuple
+
+from tile_puzzle import Heuristic, LinearConflict, ManhattanDistance, TilePuzzle, get_layout
+from pattern_database import CACHE_DIR, PatternDatabase
+from distance_table import get_distance_table
+
+'''
+Solves many independent tile puzzles at once across a pool of worker processes.
+
+Boards travel to the workers as (index, rows, cols, packed state) tuples rather than pickled
+TilePuzzle objects. Pattern databases are built once by the parent and memory-mapped by every
+worker, so the read-only tables are shared through the operating system's page cache.
+'''
+
+# Algorithm name -> TilePuzzle solver method
+ALGORITHMS = {
+    "a_star": "find_solution_a_star",
+    "ida_star": "find_solution_ida_star",
+    "iddfs": "find_solutions_iddfs",
+}
+
+HEURISTICS = ("manhattan", "linear_conflict", "pdb", "distances")
+
+# Heuristics backed by tables on disk, built once by the parent before any worker needs them
+CACHED_HEURISTICS = ("pdb", "distances")
+
+# status is "solved", "unsolvable" (the solver returned None) or "limit" (node budget or timeout hit)
+SolveResult = namedtuple("SolveResult", ["index", "moves", "status", "nodes", "seconds"])
+
+
+class SearchLimitExceeded(Exception):
+    """
+    Raised inside a solver when a puzzle runs past its node budget or timeout
+    """
+
+
+class LimitedHeuristic(Heuristic):
+    """
+    Wraps another heuristic (or none) and counts generated nodes, aborting the search
+    with SearchLimitExceeded once `max_nodes` or `timeout` seconds are exceeded
+    """
+
+    def __init__(self, rows, cols, inner=None, max_nodes=None, timeout=None):
+        super().__init__(rows, cols)
+        self.inner = inner
+        self.max_nodes = max_nodes
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.nodes = 0
+
+    def estimate(self, state):
+        return self.inner.estimate(state) if self.inner is not None else 0
+
+    def update(self, h, state, tile, src, dst):
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchLimitExceeded("node budget of %d exceeded" % self.max_nodes)
+        # Reading the clock is comparatively slow, so only check it every 1024 nodes
+        if self.deadline is not None and not self.nodes & 1023 and time.monotonic() > self.deadline:
+            raise SearchLimitExceeded("timeout exceeded")
+        return self.inner.update(h, state, tile, src, dst) if self.inner is not None else 0
+
+
+def make_heuristic(name, rows, cols, directory=CACHE_DIR):
+    """
+    Returns the heuristic called `name` for a rows x cols board, or None for no heuristic
+    """
+    if name is None:
+        return None
+    if name == "manhattan":
+        return ManhattanDistance(rows, cols)
+    if name == "linear_conflict":
+        return LinearConflict(rows, cols)
+    if name == "pdb":
+        return PatternDatabase.cached(rows, cols, directory=directory)
+    if name == "distances":
+        # Raises ValueError for shapes outside distance_table.ORACLE_SHAPES unless their table is already built
+        return get_distance_table(rows, cols, directory)
+    raise ValueError("unknown heuristic %r, expected one of %s" % (name, ", ".join(HEURISTICS)))
+
+
+# Per-process solver settings, filled in by _init_worker
+_settings = {}
+# (rows, cols) -> heuristic, built lazily once per worker process
+_heuristics = {}
+
+
+def _init_worker(algorithm, heuristic, max_nodes, timeout, directory):
+    _settings.update(algorithm=algorithm, heuristic=heuristic, max_nodes=max_nodes,
+                     timeout=timeout, directory=directory)
+    _heuristics.clear()
+
+
+def _solve_encoded(task):
+    """
+    Worker entry point: solves one puzzle given as (index, rows, cols, state)
+    """
+    index, rows, cols, state = task
+    if (rows, cols) not in _heuristics:
+        heuristic = make_heuristic(_settings["heuristic"], rows, cols, _settings["directory"])
+        if heuristic is None and _settings["algorithm"] != "iddfs":
+            # As when calling the solvers directly, A* and IDA* default to Manhattan distance
+            heuristic = ManhattanDistance(rows, cols)
+        _heuristics[(rows, cols)] = heuristic
+
+    limiter = LimitedHeuristic(rows, cols, _heuristics[(rows, cols)],
+                               _settings["max_nodes"], _settings["timeout"])
+    puzzle = TilePuzzle.from_state(rows, cols, state)
+    solver = getattr(puzzle, ALGORITHMS[_settings["algorithm"]])
+
+    start = time.monotonic()
+    try:
+        moves = solver(limiter)
+        if _settings["algorithm"] == "iddfs":
+            moves = next(moves, None)
+    except SearchLimitExceeded:
+        return SolveResult(index, None, "limit", limiter.nodes, time.monotonic() - start)
+
+    status = "solved" if moves is not None else "unsolvable"
+    return SolveResult(index, moves, status, limiter.nodes, time.monotonic() - start)
+
+
+def solve_many(boards, algorithm="ida_star", heuristic="manhattan", workers=None,
+               max_nodes=None, timeout=None, directory=CACHE_DIR):
+    """
+    Solves every board (list-of-lists boards or TilePuzzle objects) in a process pool
+    Yields a SolveResult per board in completion order; `index` is the board's position in `boards`
+    heuristic=None gives each solver its own default: Manhattan distance for A* and IDA*, none for IDDFS
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError("unknown algorithm %r, expected one of %s" % (algorithm, ", ".join(ALGORITHMS)))
+    if heuristic is not None and heuristic not in HEURISTICS:
+        raise ValueError("unknown heuristic %r, expected one of %s" % (heuristic, ", ".join(HEURISTICS)))
+
+    workers = workers or os.cpu_count() or 1
+
+    def encoded():
+        for index, board in enumerate(boards):
+            if isinstance(board, TilePuzzle):
+                yield (index, board.rows, board.cols, board.get_state())
+            else:
+                rows, cols = len(board), len(board[0])
+                yield (index, rows, cols, get_layout(rows, cols).encode(board)[0])
+
+    tasks = encoded()
+    # Keep a bounded number of puzzles in flight so `boards` can be a lazy iterable
+    window = workers * 4
+    initargs = (algorithm, heuristic, max_nodes, timeout, directory)
+    built = set()
+
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as pool:
+        pending = set()
+        for task in tasks:
+            # Build pattern databases and distance tables here first, so workers only ever memory-map them
+            if heuristic in CACHED_HEURISTICS and task[1:3] not in built:
+                make_heuristic(heuristic, task[1], task[2], directory)
+                built.add(task[1:3])
+
+            pending.add(pool.submit(_solve_encoded, task))
+            if len(pending) >= window:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
@@ -0,0 +1,286 @@
+import argparse
+import json
+import multiprocessing
+import random
+import resource
+import time
+
+from tile_puzzle import ManhattanDistance, SearchStats, TilePuzzle, get_layout
+
+'''
+Benchmark harness for the tile puzzle solvers.
+
+Builds reproducible instance sets, runs every requested solver on every instance in its own process
+under a time and memory limit, and reports nodes per second, wall time, peak RSS and whether the
+solution was optimal. Results are written as JSON and can be compared against a saved baseline.
+
+    python benchmark.py --sets 3x3 2x5 --solvers a_star ida_star --output results.json
+    python benchmark.py --sets 3x3 --baseline results.json
+'''
+
+# Solver name -> (TilePuzzle method, keyword arguments built for a rows x cols board)
+SOLVERS = {
+    "a_star": ("find_solution_a_star", lambda rows, cols: {}),
+    "ida_star": ("find_solution_ida_star", lambda rows, cols: {}),
+    "iddfs": ("find_solutions_iddfs", lambda rows, cols: {"heuristic": ManhattanDistance(rows, cols)}),
+    "bidirectional_bfs": ("find_solution_bidirectional_bfs", lambda rows, cols: {}),
+    "bidirectional_a_star": ("find_solution_bidirectional_a_star", lambda rows, cols: {}),
+}
+
+DEPTHS_3X3 = (8, 12, 16, 20, 24, 28)
+
+# Seed of the built-in korf100 set: 100 uniformly random solvable 15-puzzles, the distribution Korf drew
+# his instances from. The published boards themselves are read from a file with --korf-file
+KORF_SIZE = 100
+KORF_SEED = 1985
+
+
+def depth_instances(rows, cols, depths, count, seed):
+    """
+    Returns `count` boards at each exact optimal distance in `depths`, found by a breadth-first
+    search from the goal and sampled with a fixed seed. Only practical for small boards.
+    Each instance is a dict with a name, the board and its optimal solution length
+    """
+    # Time complexity: O(s)
+    # s is the number of reachable states
+    layout = get_layout(rows, cols)
+    wanted = set(depths)
+    by_depth = {depth: [] for depth in depths}
+
+    seen = {layout.goal}
+    frontier = [(layout.goal, layout.goal_blank)]
+    depth = 0
+    while frontier and depth < max(depths):
+        depth += 1
+        next_frontier = []
+        for state, blank in frontier:
+            for _, target in layout.neighbors[blank]:
+                child = layout.move(state, blank, target)
+                if child not in seen:
+                    seen.add(child)
+                    next_frontier.append((child, target))
+        if depth in wanted:
+            by_depth[depth] = sorted(state for state, _ in next_frontier)
+        frontier = next_frontier
+
+    rng = random.Random(seed)
+    instances = []
+    for depth in depths:
+        for number, state in enumerate(rng.sample(by_depth[depth], min(count, len(by_depth[depth])))):
+            instances.append({"name": "%dx%d-d%d-%d" % (rows, cols, depth, number),
+                              "board": layout.decode(state), "optimal": depth})
+    return instances
+
+
+def random_instances(rows, cols, count, seed):
+    """
+    Returns `count` uniformly random solvable boards drawn with a fixed seed, optimal length unknown
+    """
+    layout = get_layout(rows, cols)
+    rng = random.Random(seed)
+    return [{"name": "%dx%d-%d" % (rows, cols, number), "board": layout.decode(layout.random_state(rng)[0]),
+             "optimal": None} for number in range(count)]
+
+
+def korf_instances(path):
+    """
+    Reads Korf's 100 15-puzzle instances from `path`, one per line: an instance number, the 16 tiles
+    in row-major order with 0 for the blank, and optionally the known optimal length.
+    Korf's goal puts the blank top-left, so each board is turned 180 degrees and every tile t is
+    renamed 16 - t, a symmetry of the puzzle that preserves distances and maps his goal onto ours
+    """
+    instances = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            tiles = [int(field) for field in fields[1:17]]
+            flipped = [16 - tile if tile else 0 for tile in reversed(tiles)]
+            instances.append({"name": "korf-%s" % fields[0], "board": [flipped[row * 4:row * 4 + 4] for row in range(4)],
+                              "optimal": int(fields[17]) if len(fields) > 17 else None})
+    return instances
+
+
+def korf_set():
+    """
+    Returns the built-in korf100 set: KORF_SIZE uniformly random solvable 15-puzzles drawn with KORF_SEED,
+    the same for every run and every `--seed`
+    """
+    return [dict(instance, name="korf-%d" % (number + 1))
+            for number, instance in enumerate(random_instances(4, 4, KORF_SIZE, KORF_SEED))]
+
+
+def instance_set(name, count, seed, korf_path=None):
+    """
+    Returns the named instance set: "3x3" (by depth), "korf100", or "RxC" for random boards.
+    "korf100" gives the first `count` instances of Korf's published set when `korf_path` names it,
+    otherwise of the built-in set
+    """
+    if name == "3x3":
+        return depth_instances(3, 3, DEPTHS_3X3, count, seed)
+    if name == "korf100":
+        return (korf_instances(korf_path) if korf_path is not None else korf_set())[:count]
+    rows, cols = (int(part) for part in name.split("x"))
+    return random_instances(rows, cols, count, seed)
+
+
+def _run_child(solver, board, memory_limit, connection):
+    """
+    Runs one solver on one board inside a child process and sends back its record
+    """
+    if memory_limit:
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    record = {"status": "solved", "length": None, "expanded": 0, "generated": 0}
+    try:
+        puzzle = TilePuzzle(board)
+        method, make_kwargs = SOLVERS[solver]
+        stats = SearchStats()
+        started = time.perf_counter()
+        solution = getattr(puzzle, method)(stats=stats, **make_kwargs(puzzle.rows, puzzle.cols))
+        if method == "find_solutions_iddfs":
+            solution = next(solution, None)
+        record["seconds"] = time.perf_counter() - started
+        record.update(length=None if solution is None else len(solution), expanded=stats.expanded,
+                      generated=stats.generated)
+        if solution is None:
+            record["status"] = "unsolvable"
+    except MemoryError:
+        record["status"] = "memory"
+    # ru_maxrss is in kilobytes on Linux
+    record["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    connection.send(record)
+    connection.close()
+
+
+def run_one(solver, instance, time_limit, memory_limit):
+    """
+    Runs a solver on an instance in a fresh process, killing it after `time_limit` seconds
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_run_child, args=(solver, instance["board"], memory_limit, sender))
+    started = time.perf_counter()
+    process.start()
+    sender.close()
+
+    record = None
+    if receiver.poll(time_limit):
+        try:
+            record = receiver.recv()
+        except EOFError:
+            pass
+    wall = time.perf_counter() - started
+    if process.is_alive():
+        process.terminate()
+    process.join()
+
+    if record is None:
+        record = {"status": "timeout" if wall >= time_limit else "crashed", "length": None,
+                  "expanded": None, "generated": None, "peak_rss_kb": None}
+    record.setdefault("seconds", wall)
+    record.update(solver=solver, instance=instance["name"])
+    record["nodes_per_sec"] = record["expanded"] / record["seconds"] if record["expanded"] and record["seconds"] else None
+    return record
+
+
+def summarize(records, instances):
+    """
+    Groups records by solver, marks each solution optimal or not, and totals each group.
+    Without a known optimum, the shortest solution any solver found is used instead
+    """
+    best = {instance["name"]: instance["optimal"] for instance in instances}
+    for record in records:
+        if record["length"] is not None and best[record["instance"]] is None:
+            best[record["instance"]] = record["length"]
+        elif record["length"] is not None and record["length"] < best[record["instance"]]:
+            best[record["instance"]] = record["length"]
+
+    summary = {}
+    for record in records:
+        record["optimal"] = record["length"] is not None and record["length"] == best[record["instance"]]
+        group = summary.setdefault(record["solver"], {"runs": 0, "solved": 0, "optimal": 0, "seconds": 0.0,
+                                                      "expanded": 0, "peak_rss_kb": 0})
+        group["runs"] += 1
+        if record["status"] == "solved":
+            group["solved"] += 1
+            group["optimal"] += record["optimal"]
+            group["seconds"] += record["seconds"]
+            group["expanded"] += record["expanded"]
+        group["peak_rss_kb"] = max(group["peak_rss_kb"], record["peak_rss_kb"] or 0)
+
+    for group in summary.values():
+        group["nodes_per_sec"] = group["expanded"] / group["seconds"] if group["seconds"] else None
+    return summary
+
+
+def run_benchmark(set_names, solver_names, count=10, seed=0, time_limit=60.0, memory_limit=None, korf_path=None):
+    """
+    Runs every solver on every instance of every set
+    Returns {"sets": {set name: {"records": [...], "summary": {solver: totals}}}}
+    """
+    results = {"seed": seed, "time_limit": time_limit, "memory_limit_mb": memory_limit, "sets": {}}
+    for set_name in set_names:
+        instances = instance_set(set_name, count, seed, korf_path)
+        records = [run_one(solver, instance, time_limit, memory_limit)
+                   for instance in instances for solver in solver_names]
+        results["sets"][set_name] = {"records": records, "summary": summarize(records, instances)}
+    return results
+
+
+def comparison_table(results, baseline=None):
+    """
+    Formats one row per set and solver, with the change in time and nodes/sec against `baseline`
+    """
+    def rate(value):
+        return "%.0f" % value if value else "-"
+
+    def change(current, previous):
+        return "%+.0f%%" % (100.0 * (current - previous) / previous) if current and previous else "-"
+
+    header = ("set", "solver", "solved", "optimal", "seconds", "nodes/s", "rss MB", "time vs base", "nodes/s vs base")
+    rows = [header]
+    for set_name, data in results["sets"].items():
+        for solver, group in data["summary"].items():
+            previous = (baseline or {}).get("sets", {}).get(set_name, {}).get("summary", {}).get(solver, {})
+            rows.append((set_name, solver, "%d/%d" % (group["solved"], group["runs"]), str(group["optimal"]),
+                         "%.3f" % group["seconds"], rate(group["nodes_per_sec"]),
+                         "%.1f" % (group["peak_rss_kb"] / 1024.0),
+                         change(group["seconds"], previous.get("seconds")),
+                         change(group["nodes_per_sec"], previous.get("nodes_per_sec"))))
+
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tile puzzle solvers")
+    parser.add_argument("--sets", nargs="+", default=["3x3", "2x5", "3x4", "korf100"],
+                        help='instance sets: "3x3" (by depth), "korf100", or "RxC" for random boards')
+    parser.add_argument("--solvers", nargs="+", default=sorted(SOLVERS), choices=sorted(SOLVERS))
+    parser.add_argument("--count", type=int, default=10,
+                        help="instances per depth or per random set, and of korf100 (100 runs all of it)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--time-limit", type=float, default=60.0, help="seconds per run")
+    parser.add_argument("--memory-limit", type=int, default=None, help="address space limit per run, in MB")
+    parser.add_argument("--korf-file", help="Korf's published 100 instances, one per line, to use as korf100 "
+                                            "instead of the built-in set")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.sets, args.solvers, args.count, args.seed, args.time_limit,
+                            args.memory_limit, args.korf_file)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    print(comparison_table(results, baseline))
+
+
+if __name__ == "__main__":
+    main()
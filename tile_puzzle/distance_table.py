@@ -0,0 +1,472 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+from functools import lru_cache
+from math import factorial
+
+from tile_puzzle import Heuristic, get_layout
+from pattern_database import CACHE_DIR
+
+'''
+Complete distance tables for small tile boards, built by a disk-backed breadth-first search.
+
+Every solvable state of a rows x cols board gets a dense index (StateIndex), and a memory-mapped file
+holds 4 bits per index: the state's distance from the goal modulo 15, or 15 while it is unreached.
+The table is its own frontier. Layer d is expanded by scanning the file for entries equal to d mod 15
+and marking their unreached neighbors, so the search needs no sets or queues and its memory is the
+mapped files alone (about 120 MB for the 240 million states of 3x4 or 2x6, plus a 30 MB bitmap).
+Earlier layers share the residue of every 15th layer, so a bitmap beside the table marks each state
+once it has been expanded and the scan skips it after that. Every state is expanded exactly once.
+
+Every move changes the blank's cell between the two colors of a checkerboard, so neighboring states
+are exactly one move closer or farther from the goal. The residue therefore pins down the exact
+distance: walking to the neighbor one residue lower always reaches the goal, and a search that knows a
+parent's distance gets each child's in O(1), which makes the table an exact heuristic.
+
+The header records the layer being expanded and how far the scan has got, and the file is flushed at
+every checkpoint, so an interrupted build resumes where it stopped. Builds run in `path`.partial,
+which replaces `path` once complete, with the bitmap in `path`.expanded until then. The header also keeps the number of states at each distance.
+
+    python distance_table.py 3 3
+    python distance_table.py 3 4 --output table_3x4.bin
+    python distance_table.py --oracle
+
+The small shapes in ORACLE_SHAPES back TilePuzzle.optimal_moves(), which reads an optimal solution
+straight off the table. Their tables are built into the cache on first use and memory-mapped after that.
+Tables of larger shapes are only ever built by running this script, and are loaded once complete.
+'''
+
+MAGIC = b"TPDT"
+VERSION = 1
+MODULUS = 15
+UNREACHED = 15
+MAX_LAYERS = 128
+
+# magic, version, rows, cols, complete, layers found, scan position, then states per distance
+HEADER = "<4sHHHHQQ%dQ" % MAX_LAYERS
+HEADER_SIZE = struct.calcsize(HEADER)
+POSITION_OFFSET = struct.calcsize("<4sHHHHQ")
+
+# Shapes whose tables are small enough to build on demand for TilePuzzle.optimal_moves()
+ORACLE_SHAPES = ((2, 2), (2, 3), (2, 4), (3, 3))
+
+
+class StateIndex(object):
+    """
+    Perfect hash of the solvable states of one board shape onto 0 .. size! / 2 - 1.
+
+    Reading the tiles row by row, skipping the blank, gives a permutation of the m = size - 1 tiles whose
+    parity is fixed by the blank's cell (see BoardLayout.is_solvable). Its Lehmer code d_0 .. d_(m-1) sums
+    to its inversion count and ranks it as sum(d_i × (m - 1 - i)!), where the last two digits only
+    contribute d_(m-2) ∈ {0, 1}, the parity bit. Dropping that bit leaves a dense rank below m! / 2, and
+    index = blank × m! / 2 + rank.
+    """
+
+    def __init__(self, rows, cols):
+        if rows < 2 or cols < 2:
+            raise ValueError("state indexes need at least two rows and two columns")
+        self.layout = get_layout(rows, cols)
+        size = self.layout.size
+        tiles = size - 1
+        self.half = factorial(tiles) // 2
+        self.count = size * self.half
+        # Weight of each of the first tiles - 2 Lehmer digits once the parity bit is dropped
+        self.weights = tuple(factorial(tiles - 1 - i) // 2 for i in range(tiles - 2))
+        # Inversion parity a solvable state needs with its blank at each cell
+        self.parity = tuple(0 if cols % 2 else (rows - 1 - pos // cols) % 2 for pos in range(size))
+
+    def rank_cells(self, cells):
+        """
+        Returns the index of a solvable state given as its flat, row-major list of tiles
+        """
+        # Time complexity: O(n)
+        # n is r × c
+        blank = cells.index(0)
+        weights = self.weights
+        last = len(weights)
+        rank = 0
+        seen = 0
+        i = 0
+        for tile in cells:
+            if not tile:
+                continue
+            if i == last:
+                break
+            value = tile - 1
+            rank += (value - (seen & ((1 << value) - 1)).bit_count()) * weights[i]
+            seen |= 1 << value
+            i += 1
+        return blank * self.half + rank
+
+    def rank(self, state):
+        """
+        Returns the index of a solvable packed state
+        """
+        return self.rank_cells(self.layout.unpack(state))
+
+    def unrank_cells(self, index):
+        """
+        Returns the flat, row-major list of tiles of the state at `index`
+        """
+        # Time complexity: O(n^2)
+        # n is r × c
+        blank, rank = divmod(index, self.half)
+        digits = []
+        for weight in self.weights:
+            digit, rank = divmod(rank, weight)
+            digits.append(digit)
+        digits.append((self.parity[blank] - sum(digits)) % 2)
+        digits.append(0)
+
+        remaining = list(range(1, self.layout.size))
+        order = [remaining.pop(digit) for digit in digits]
+        order.insert(blank, 0)
+        return order
+
+    def unrank(self, index):
+        """
+        Returns (state, blank_pos) of the state at `index`
+        """
+        cells = self.unrank_cells(index)
+        return self.layout.pack(cells), cells.index(0)
+
+    def child_index(self, cells, index, blank, target):
+        """
+        Returns the index of the state reached by sliding the tile at `target` into the blank at `blank`
+        `cells` is the parent's tile list and is left unchanged
+        """
+        # Time complexity: O(1) for sideways moves, O(n) otherwise
+        cols = self.layout.cols
+        if target // cols == blank // cols:
+            # The reading order of the tiles is unchanged, only the blank's cell moves
+            return index + (target - blank) * self.half
+        cells[blank], cells[target] = cells[target], 0
+        child = self.rank_cells(cells)
+        cells[target], cells[blank] = cells[blank], 0
+        return child
+
+
+@lru_cache(maxsize=None)
+def get_state_index(rows, cols):
+    """
+    Returns the shared StateIndex for a rows x cols board
+    """
+    return StateIndex(rows, cols)
+
+
+def _read_nibble(data, index):
+    return (data[HEADER_SIZE + (index >> 1)] >> ((index & 1) << 2)) & 15
+
+
+def _matching_bytes(residue, count=False):
+    """
+    Translation table sending each byte to 1 if either of its nibbles equals `residue`, 0 otherwise,
+    or with `count` to the number of its nibbles that do
+    """
+    if count:
+        return bytes(((byte & 15) == residue) + ((byte >> 4) == residue) for byte in range(256))
+    return bytes(((byte & 15) == residue) or ((byte >> 4) == residue) for byte in range(256))
+
+
+def _create(path, rows, cols, index):
+    """
+    Writes a table with every state unreached except the goal, at distance 0
+    """
+    data_size = (index.count + 1) // 2
+    with open(path, "wb") as f:
+        f.write(bytes(HEADER_SIZE))
+        chunk = b"\xff" * (1 << 20)
+        for start in range(0, data_size, len(chunk)):
+            f.write(chunk[:data_size - start])
+
+    with open(path, "r+b") as f:
+        data = mmap.mmap(f.fileno(), 0)
+    goal = index.rank(index.layout.goal)
+    data[HEADER_SIZE + (goal >> 1)] &= ~(15 << ((goal & 1) << 2)) & 255
+    histogram = [1] + [0] * (MAX_LAYERS - 1)
+    struct.pack_into(HEADER, data, 0, MAGIC, VERSION, rows, cols, 0, 1, 0, *histogram)
+    data.flush()
+    data.close()
+
+
+def _open_marks(path, count):
+    """
+    Memory-maps the bitmap of expanded states at `path`, creating it with no state marked
+    """
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.truncate((count + 7) // 8)
+    with open(path, "r+b") as f:
+        return mmap.mmap(f.fileno(), 0)
+
+
+def build_distance_table(rows, cols, path, layers=None, checkpoint=1 << 20):
+    """
+    Builds, or resumes building, the distance table of a rows x cols board at `path`.
+    Work happens in `path`.partial, flushed every `checkpoint` scanned states and after every layer,
+    and `path`.expanded marks the states already expanded.
+    With `layers`, stops after expanding that many layers; calling again carries on.
+    Returns True once the table is complete and in place at `path`
+    """
+    # Time complexity: O(s × n + s × L)
+    # s is the number of states, n is r × c, L is the deepest distance (each layer is a byte scan, each state expands once)
+    if os.path.exists(path):
+        return True
+    index = StateIndex(rows, cols)
+    partial_path = path + ".partial"
+    marks_path = path + ".expanded"
+    if not os.path.exists(partial_path):
+        _create(partial_path, rows, cols, index)
+
+    with open(partial_path, "r+b") as f:
+        data = mmap.mmap(f.fileno(), 0)
+    header = struct.unpack_from(HEADER, data, 0)
+    magic, version, file_rows, file_cols, complete, found, position = header[:7]
+    histogram = list(header[7:])
+    if magic != MAGIC or version != VERSION or (file_rows, file_cols) != (rows, cols):
+        data.close()
+        raise ValueError("%s is not a version %d distance table of a %dx%d board" % (partial_path, VERSION, rows, cols))
+
+    # A missing bitmap (a build interrupted before it existed) only costs re-expanding the states seen so far
+    marks = _open_marks(marks_path, index.count)
+    layout = index.layout
+    neighbors = layout.neighbors
+    data_size = len(data) - HEADER_SIZE
+    expanded = 0
+
+    while not complete:
+        if layers is not None and expanded >= layers:
+            break
+        depth = found - 1
+        residue, next_residue = depth % MODULUS, (depth + 1) % MODULUS
+        next_high, next_low = next_residue << 4, next_residue
+        matching = _matching_bytes(residue)
+
+        # Scan the layer's bytes from the checkpointed position, skipping bytes with no match
+        start = position >> 1
+        while start < data_size:
+            end = min(start + checkpoint // 2 + 1, data_size)
+            hits = data[HEADER_SIZE + start:HEADER_SIZE + end].translate(matching)
+            offset = hits.find(1)
+            while offset >= 0:
+                byte = data[HEADER_SIZE + start + offset]
+                for odd in (0, 1):
+                    if (byte >> (odd << 2)) & 15 != residue:
+                        continue
+                    state = ((start + offset) << 1) | odd
+                    # Skip states of the earlier layers sharing this residue
+                    mark, bit = state >> 3, 1 << (state & 7)
+                    if marks[mark] & bit:
+                        continue
+                    marks[mark] |= bit
+                    cells = index.unrank_cells(state)
+                    blank = state // index.half
+                    for _, target in neighbors[blank]:
+                        child = index.child_index(cells, state, blank, target)
+                        at = HEADER_SIZE + (child >> 1)
+                        value = data[at]
+                        if child & 1:
+                            if value >> 4 == UNREACHED:
+                                data[at] = (value & 15) | next_high
+                        elif value & 15 == UNREACHED:
+                            data[at] = (value & 240) | next_low
+                offset = hits.find(1, offset + 1)
+
+            # Checkpoint: the entries written so far, then the marks of the states that wrote them,
+            # then the position they cover. Expanding a state twice writes nothing new, so a crash between
+            # these flushes is harmless
+            start = end
+            data.flush()
+            marks.flush()
+            struct.pack_into("<Q", data, POSITION_OFFSET, start << 1)
+            data.flush(0, HEADER_SIZE)
+
+        # The new layer is every entry with its residue, less the earlier layers sharing it
+        counting = _matching_bytes(next_residue, count=True)
+        total = 0
+        for start in range(0, data_size, 1 << 20):
+            total += sum(data[HEADER_SIZE + start:HEADER_SIZE + min(start + (1 << 20), data_size)].translate(counting))
+        size = total - sum(histogram[layer] for layer in range(depth + 1) if layer % MODULUS == next_residue)
+        if size:
+            if found == MAX_LAYERS:
+                data.close()
+                marks.close()
+                raise ValueError("more than %d layers do not fit the header" % MAX_LAYERS)
+            histogram[found] = size
+            found += 1
+        else:
+            complete = 1
+        position = 0
+        expanded += 1
+        struct.pack_into(HEADER, data, 0, MAGIC, VERSION, rows, cols, complete, found, position, *histogram)
+        data.flush()
+
+    data.close()
+    marks.close()
+    if complete:
+        os.replace(partial_path, path)
+        os.remove(marks_path)
+    return bool(complete)
+
+
+class DistanceTable(Heuristic):
+    """
+    Exact distances to the goal, read from a complete table written by build_distance_table.
+    As a heuristic it is perfect: estimate() walks down to the goal in O(d) lookups, and update()
+    tells whether a child is one move closer or farther than its parent from a single lookup
+    """
+
+    def __init__(self, rows, cols, data, histogram):
+        super().__init__(rows, cols)
+        self.index = get_state_index(rows, cols)
+        self.goal_index = self.index.rank(self.layout.goal)
+        # Moves of a blank at each cell with sideways ones first, as their indexes cost O(1)
+        cols = self.layout.cols
+        self.walk_order = tuple(tuple(sorted(options, key=lambda option, pos=pos: option[1] // cols != pos // cols))
+                                for pos, options in enumerate(self.layout.neighbors))
+        self.data = data
+        # histogram[d] = number of states at distance d
+        self.histogram = histogram
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-maps a complete table written by build_distance_table
+        """
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = struct.unpack_from(HEADER, data, 0)
+        magic, version, rows, cols, complete, found = header[:6]
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %d distance table" % (path, VERSION))
+        if not complete or len(data) != HEADER_SIZE + (StateIndex(rows, cols).count + 1) // 2:
+            raise ValueError("%s is incomplete or corrupt" % path)
+        return cls(rows, cols, data, list(header[7:7 + found]))
+
+    @classmethod
+    def cached(cls, rows, cols, directory=CACHE_DIR):
+        """
+        Loads the table for this shape from `directory`, building it first (or finishing an
+        interrupted build) if needed
+        """
+        path = table_path(rows, cols, directory)
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            build_distance_table(rows, cols, path)
+        return cls.load(path)
+
+    @property
+    def gods_number(self):
+        """
+        The largest distance of any state from the goal
+        """
+        return len(self.histogram) - 1
+
+    def residue(self, state):
+        """
+        Returns the distance of a solvable packed state modulo 15
+        Solvability is not checked here: the solvers check it once per puzzle before searching
+        """
+        return _read_nibble(self.data, self.index.rank(state))
+
+    def solution(self, state):
+        """
+        Returns an optimal list of moves from a solvable packed state to the goal
+        Each step takes the neighbor one residue lower, which is one move closer, so nothing is searched
+        The state must be solvable, which is not checked (an unsolvable one ranks as some other state)
+        """
+        # Time complexity: O(d × n)
+        # d is the distance, n is r × c
+        index, data, neighbors = self.index, self.data, self.walk_order
+        cells = self.layout.unpack(state)
+        blank = cells.index(0)
+        position = index.rank_cells(cells)
+        residue = _read_nibble(data, position)
+
+        moves = []
+        while position != self.goal_index:
+            closer = (residue - 1) % MODULUS
+            for move, target in neighbors[blank]:
+                child = index.child_index(cells, position, blank, target)
+                if _read_nibble(data, child) == closer:
+                    cells[blank], cells[target] = cells[target], 0
+                    position, blank, residue = child, target, closer
+                    moves.append(move)
+                    break
+        return moves
+
+    def distance(self, state):
+        """
+        Returns the exact number of moves from a packed state to the goal, or None if it is unsolvable
+        """
+        # Time complexity: O(d × n + n log n)
+        if not self.layout.is_solvable(state):
+            return None
+        return len(self.solution(state))
+
+    def estimate(self, state):
+        # Time complexity: O(d × n)
+        return len(self.solution(state))
+
+    def update(self, h, state, tile, src, dst):
+        # Time complexity: O(r × c)
+        # Neighbors differ by exactly one move, and 15 is odd, so the residue tells which way
+        return h - 1 if self.residue(state) == (h - 1) % MODULUS else h + 1
+
+
+def table_path(rows, cols, directory=CACHE_DIR):
+    """
+    Returns where the distance table of a rows x cols board is kept in `directory`
+    """
+    return os.path.join(directory, "distances_%dx%d.bin" % (rows, cols))
+
+
+@lru_cache(maxsize=None)
+def get_distance_table(rows, cols, directory=CACHE_DIR):
+    """
+    Returns the shared DistanceTable of a rows x cols board, loading it from `directory` on the first call.
+    Tables of the ORACLE_SHAPES are built there first if no process has done so yet. Other shapes need a
+    complete table built beforehand with `python distance_table.py rows cols`
+    """
+    if (rows, cols) in ORACLE_SHAPES:
+        return DistanceTable.cached(rows, cols, directory)
+    path = table_path(rows, cols, directory)
+    if not os.path.exists(path):
+        raise ValueError("no distance table of a %dx%d board in %s; only %s are built on demand, "
+                         "build it with `python distance_table.py %d %d`"
+                         % (rows, cols, directory, ", ".join("%dx%d" % shape for shape in ORACLE_SHAPES),
+                            rows, cols))
+    return DistanceTable.load(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the complete distance table of a tile board")
+    parser.add_argument("rows", type=int, nargs="?")
+    parser.add_argument("cols", type=int, nargs="?")
+    parser.add_argument("--output", help="table file (default: distances_RxC.bin in the pattern database cache)")
+    parser.add_argument("--checkpoint", type=int, default=1 << 20, help="states scanned between checkpoints")
+    parser.add_argument("--oracle", action="store_true", help="build the tables of every shape in ORACLE_SHAPES")
+    args = parser.parse_args()
+    if args.oracle:
+        shapes = ORACLE_SHAPES
+    elif args.rows is not None and args.cols is not None:
+        shapes = ((args.rows, args.cols),)
+    else:
+        parser.error("give rows and cols, or --oracle")
+
+    for rows, cols in shapes:
+        path = args.output if len(shapes) == 1 and args.output else table_path(rows, cols)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        started = time.perf_counter()
+        build_distance_table(rows, cols, path, checkpoint=args.checkpoint)
+        table = DistanceTable.load(path)
+        print("%dx%d: %d states in %.1fs, god's number %d" % (rows, cols, sum(table.histogram),
+                                                             time.perf_counter() - started, table.gods_number))
+        for distance, count in enumerate(table.histogram):
+            print("%3d  %d" % (distance, count))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import mmap
+import os
+import struct
+
+from tile_puzzle import Heuristic, get_layout
+
+'''
+Additive disjoint pattern databases for the generalized tile puzzle.
+
+The tiles are split into disjoint groups. For each group a table stores, for every placement of
+that group's tiles, the fewest moves of those tiles needed to bring them home, found by a backward
+breadth-first search from the goal. Other tiles are ignored and only moves of the group's own tiles
+are counted, so the values of disjoint groups can be added and the sum is still admissible.
+
+Tables are plain byte arrays (one byte per entry) and can be saved to disk and memory-mapped back,
+so later processes start instantly and share the same pages.
+
+Estimates are returned as PatternEstimate, an int that also carries the table index of every group.
+A move only changes its tile's group, and that group's index by (dst - src) × the tile's weight, so
+update() finds a child's estimate from its parent's in O(1) without reading the state.
+'''
+
+MAGIC = b"TPDB"
+VERSION = 1
+UNREACHED = 255
+
+# Default directory for PatternDatabase.cached()
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdb_cache")
+
+
+def default_groups(rows, cols, group_size=5):
+    """
+    Splits tiles 1..rows*cols-1 into row-major groups of at most `group_size` tiles
+    (5-5-5 for the 15-puzzle, 5-3 for the 8-puzzle)
+    """
+    tiles = list(range(1, rows * cols))
+    return [tuple(tiles[i:i + group_size]) for i in range(0, len(tiles), group_size)]
+
+
+def build_table(rows, cols, group):
+    """
+    Builds the pattern table of one group of tiles by breadth-first search back from the goal.
+
+    An entry is indexed by the cells of the group's tiles: index = sum(pos_i * size^i),
+    where pos_i is the cell of the i-th tile of the group. Moving a tile from cell p to cell q
+    therefore changes the index by (q - p) * size^i.
+    A group tile may slide into any neighboring cell not held by another group tile, since that
+    cell could hold the blank, which keeps the table a lower bound for the real puzzle.
+    """
+    # Time complexity: O(size^k + P(size, k) × k)
+    # size is rows × cols, k is the number of tiles in the group
+    layout = get_layout(rows, cols)
+    size = layout.size
+    k = len(group)
+    weights = [size ** i for i in range(k)]
+    adjacent = [tuple(target for _, target in options) for options in layout.neighbors]
+
+    table = bytearray([UNREACHED]) * (size ** k)
+    goal_index = sum((tile - 1) * weight for tile, weight in zip(group, weights))
+    table[goal_index] = 0
+
+    frontier = [goal_index]
+    depth = 0
+    while frontier:
+        depth += 1
+        next_frontier = []
+        for index in frontier:
+            # Decode the cells of the group's tiles
+            cells = []
+            rest = index
+            for _ in range(k):
+                rest, pos = divmod(rest, size)
+                cells.append(pos)
+
+            for slot, pos in enumerate(cells):
+                weight = weights[slot]
+                for target in adjacent[pos]:
+                    if target in cells:
+                        continue
+                    successor = index + (target - pos) * weight
+                    if table[successor] == UNREACHED:
+                        table[successor] = depth
+                        next_frontier.append(successor)
+        frontier = next_frontier
+
+    return table
+
+
+class PatternEstimate(int):
+    """
+    The value of a pattern database estimate, usable anywhere as an int, with the table index of
+    every group in `indices` so that children can be estimated from it incrementally
+    """
+
+    def __new__(cls, value, indices):
+        estimate = super().__new__(cls, value)
+        estimate.indices = indices
+        return estimate
+
+
+class PatternDatabase(Heuristic):
+    """
+    Additive heuristic summing one pattern table lookup per group of tiles
+    """
+
+    def __init__(self, rows, cols, groups, tables):
+        super().__init__(rows, cols)
+        self.groups = [tuple(group) for group in groups]
+        self.tables = tables
+
+        size = self.layout.size
+        # weight[tile] = size^slot of the tile in its group, group_of[tile] = index of its group
+        self.weight = [0] * size
+        self.group_of = [-1] * size
+        for number, group in enumerate(self.groups):
+            for slot, tile in enumerate(group):
+                self.weight[tile] = size ** slot
+                self.group_of[tile] = number
+
+    @classmethod
+    def build(cls, rows, cols, groups=None):
+        """
+        Builds every table in memory
+        """
+        groups = groups or default_groups(rows, cols)
+        return cls(rows, cols, groups, [build_table(rows, cols, group) for group in groups])
+
+    def save(self, path):
+        """
+        Writes the header and tables to `path`, replacing it atomically
+        """
+        header = struct.pack("<4sHHHH", MAGIC, VERSION, self.layout.rows, self.layout.cols, len(self.groups))
+        for group in self.groups:
+            header += struct.pack("<H", len(group)) + bytes(group)
+
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, "wb") as f:
+            f.write(header)
+            for table in self.tables:
+                f.write(table)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-maps a file written by save(); the tables are read-only views into the mapping
+        """
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, rows, cols, count = struct.unpack_from("<4sHHHH", data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %d pattern database" % (path, VERSION))
+
+        offset = struct.calcsize("<4sHHHH")
+        groups = []
+        for _ in range(count):
+            (k,) = struct.unpack_from("<H", data, offset)
+            offset += 2
+            groups.append(tuple(data[offset:offset + k]))
+            offset += k
+
+        size = rows * cols
+        view = memoryview(data)
+        tables = []
+        for group in groups:
+            length = size ** len(group)
+            tables.append(view[offset:offset + length])
+            offset += length
+        if offset != len(data):
+            raise ValueError("%s is truncated or corrupt" % path)
+
+        return cls(rows, cols, groups, tables)
+
+    @classmethod
+    def cached(cls, rows, cols, groups=None, directory=CACHE_DIR):
+        """
+        Loads the database for this shape and partition from `directory`,
+        building and saving it first if no process has done so yet
+        """
+        groups = groups or default_groups(rows, cols)
+        name = "pdb_%dx%d_%s.bin" % (rows, cols, "-".join(".".join(map(str, group)) for group in groups))
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            cls.build(rows, cols, groups).save(path)
+        return cls.load(path)
+
+    def group_index(self, state, number):
+        """
+        Returns the table index of one group in a packed state
+        """
+        layout = self.layout
+        mask, weight, group_of = layout.mask, self.weight, self.group_of
+        index = 0
+        for pos, shift in enumerate(layout.shifts):
+            tile = (state >> shift) & mask
+            if group_of[tile] == number:
+                index += pos * weight[tile]
+        return index
+
+    def estimate(self, state):
+        # Time complexity: O(r × c)
+        layout = self.layout
+        mask, weight, group_of = layout.mask, self.weight, self.group_of
+        indices = [0] * len(self.groups)
+        for pos, shift in enumerate(layout.shifts):
+            tile = (state >> shift) & mask
+            if group_of[tile] >= 0:
+                indices[group_of[tile]] += pos * weight[tile]
+        return PatternEstimate(sum(table[index] for table, index in zip(self.tables, indices)), tuple(indices))
+
+    def update(self, h, state, tile, src, dst):
+        # Time complexity: O(g) from a PatternEstimate, O(r × c) from a plain int
+        # g is the number of groups
+        if not isinstance(h, PatternEstimate):
+            return self.estimate(state)
+        number = self.group_of[tile]
+        if number < 0:
+            return h
+        # Only the moved tile's group changes, and its index moves by (dst - src) * weight
+        indices = h.indices
+        before = indices[number]
+        after = before + (dst - src) * self.weight[tile]
+        table = self.tables[number]
+        return PatternEstimate(h - table[before] + table[after],
+                               indices[:number] + (after,) + indices[number + 1:])
@@ -1,5 +1,19 @@
+import os
+import random
+import tempfile
 import unittest
-from tile_puzzle import create_tile_puzzle
+from tile_puzzle import (
+    create_tile_puzzle,
+    get_layout,
+    TilePuzzle,
+    ManhattanDistance,
+    LinearConflict,
+    SearchStats
+)
+from pattern_database import PatternDatabase
+from distance_table import DistanceTable, StateIndex, build_distance_table, table_path
+from batch_solver import solve_many
+from benchmark import depth_instances, instance_set, run_benchmark
 
 """
 Generalized Tile Puzzle solver supporting arbitrary board sizes.
@@ -145,5 +159,333 @@ class TestTilePuzzle(unittest.TestCase):
             test_puzzle.perform_move(move)
         self.assertTrue(test_puzzle.is_solved())
 
+    def test_state_round_trip(self):
+        """ Tests that a board survives packing into a state int and decoding back, including the cached blank """
+        # Time complexity: O(r × c)
+        # r is rows, c is columns
+
+        board = [[4, 1, 3], [0, 2, 5]]
+        puzzle = TilePuzzle(board)
+        self.assertEqual(puzzle.blank, 3)
+        rebuilt = TilePuzzle.from_state(2, 3, puzzle.get_state())
+        self.assertEqual(rebuilt.get_board(), board)
+        self.assertEqual(rebuilt.blank, 3)
+        self.assertEqual(get_layout(2, 3).goal, create_tile_puzzle(2, 3).get_state())
+
+    def test_board_property(self):
+        """ Tests that the board attribute reflects moves, rejects cell writes and can be reassigned """
+        # Time complexity: O(r × c)
+        # r is rows, c is columns
+
+        puzzle = create_tile_puzzle(2, 2)
+        puzzle.perform_move("up")
+        self.assertEqual(puzzle.board, ((1, 0), (3, 2)))
+        with self.assertRaises(TypeError):
+            puzzle.board[0][1] = 2
+        puzzle.board = [[1, 2], [3, 0]]
+        self.assertTrue(puzzle.is_solved())
+
+    def test_find_solution_a_star_optimal(self):
+        """ Tests that find_solution_a_star and find_solutions_iddfs agree on the optimal solution length """
+        # Time complexity: O(b^d) in worst case
+        # b is branching factor, d is depth of solution
+
+        puzzle = TilePuzzle([[4, 1, 2], [0, 8, 3], [7, 6, 5]])
+        path = puzzle.find_solution_a_star()
+        self.assertEqual(len(path), 9)
+        self.assertEqual(len(next(puzzle.find_solutions_iddfs())), 9)
+
+    def test_find_solution_ida_star(self):
+        """ Tests that find_solution_ida_star returns an optimal move sequence, including on a 4x4 board """
+        # Time complexity: O(b^d) in worst case, but not likely
+        # b is branching factor, d is depth of solution
+
+        puzzle = TilePuzzle([[4, 1, 2], [0, 8, 3], [7, 6, 5]])
+        self.assertEqual(len(puzzle.find_solution_ida_star()), len(puzzle.find_solution_a_star()))
+
+        puzzle = TilePuzzle([[5, 1, 3, 4], [9, 2, 7, 8], [0, 6, 10, 12], [13, 14, 11, 15]])
+        path = puzzle.find_solution_ida_star()
+        self.assertEqual(len(path), 8)
+        for move in path:
+            self.assertTrue(puzzle.perform_move(move))
+        self.assertTrue(puzzle.is_solved())
+
+    def test_heuristics_admissible(self):
+        """ Tests that every heuristic underestimates the optimal solution and that all solvers stay optimal with it """
+        # Time complexity: O(b^d) in worst case
+        # b is branching factor, d is depth of solution
+
+        puzzle = TilePuzzle([[4, 1, 2], [0, 8, 3], [7, 6, 5]])
+        heuristics = [ManhattanDistance(3, 3), LinearConflict(3, 3), PatternDatabase.build(3, 3)]
+        for heuristic in heuristics:
+            self.assertLessEqual(heuristic.estimate(puzzle.get_state()), 9)
+            self.assertEqual(len(puzzle.find_solution_a_star(heuristic)), 9)
+            self.assertEqual(len(puzzle.find_solution_ida_star(heuristic)), 9)
+            self.assertEqual(len(next(puzzle.find_solutions_iddfs(heuristic))), 9)
+
+    def test_linear_conflict(self):
+        """ Tests that two tiles swapped in their goal row cost 2 more than their Manhattan distance """
+        # Time complexity: O(r × c)
+        # r is rows, c is columns
+
+        state = TilePuzzle([[2, 1, 3], [4, 5, 6], [7, 8, 0]]).get_state()
+        self.assertEqual(ManhattanDistance(3, 3).estimate(state), 2)
+        self.assertEqual(LinearConflict(3, 3).estimate(state), 4)
+
+    def test_pattern_database_save_load(self):
+        """ Tests that a saved pattern database is memory-mapped back with identical tables """
+        # Time complexity: O(t)
+        # t is the total table size
+
+        database = PatternDatabase.build(2, 3, [(1, 2), (3, 4, 5)])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "pdb.bin")
+            database.save(path)
+            loaded = PatternDatabase.load(path)
+            self.assertEqual(loaded.groups, database.groups)
+            self.assertEqual([bytes(table) for table in loaded.tables], [bytes(table) for table in database.tables])
+
+    def test_pattern_database_update(self):
+        """ Tests that incremental pattern database updates match full estimates along a random walk """
+        # Time complexity: O(m × r × c)
+        # m is the number of moves
+
+        database = PatternDatabase.build(3, 3)
+        layout = database.layout
+        rng = random.Random(5)
+        state, blank = layout.goal, layout.size - 1
+        h = database.estimate(state)
+        for _ in range(200):
+            _, target = rng.choice(layout.neighbors[blank])
+            tile = (state >> layout.shifts[target]) & layout.mask
+            state = state + (tile << layout.shifts[blank]) - (tile << layout.shifts[target])
+            h = database.update(h, state, tile, target, blank)
+            blank = target
+            self.assertEqual(h, database.estimate(state))
+            self.assertEqual(h.indices, database.estimate(state).indices)
+        # A plain int carries no group indices, so the estimate is recomputed from the state
+        self.assertEqual(database.update(int(h), state, 1, 0, 1), database.estimate(state))
+
+    def test_state_index(self):
+        """ Tests that ranking maps the solvable states of a shape one-to-one onto 0 .. size! / 2 - 1 """
+        # Time complexity: O(s × n^2)
+        # s is the number of states, n is r × c
+
+        index = StateIndex(2, 3)
+        layout = get_layout(2, 3)
+        states = set()
+        for position in range(index.count):
+            state, blank = index.unrank(position)
+            self.assertTrue(layout.is_solvable(state))
+            self.assertEqual(layout.find_blank(state), blank)
+            self.assertEqual(index.rank(state), position)
+            states.add(state)
+        self.assertEqual(len(states), 360)
+
+    def test_distance_table(self):
+        """ Tests the distance histograms of small shapes, resuming an interrupted build, and exact distances """
+        # Time complexity: O(s × n + s × L)
+        # s is the number of states, n is r × c, L is the deepest distance
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "distances_2x4.bin")
+            self.assertFalse(build_distance_table(2, 4, path, layers=20, checkpoint=1000))
+            self.assertFalse(os.path.exists(path))
+            self.assertTrue(build_distance_table(2, 4, path, checkpoint=1000))
+            resumed = DistanceTable.load(path)
+            self.assertEqual(sum(resumed.histogram), 20160)
+            self.assertEqual(resumed.gods_number, 36)
+
+            other = os.path.join(directory, "other.bin")
+            build_distance_table(2, 4, other)
+            with open(path, "rb") as f, open(other, "rb") as g:
+                self.assertEqual(f.read(), g.read())
+
+            table = DistanceTable.cached(2, 3, directory=directory)
+            self.assertEqual(table.gods_number, 21)
+            self.assertEqual(table.histogram[:4], [1, 2, 3, 5])
+
+            puzzle = TilePuzzle([[0, 5, 4], [3, 2, 1]])
+            self.assertEqual(table.distance(puzzle.get_state()), len(puzzle.find_solution_a_star()))
+            self.assertEqual(len(puzzle.find_solution_ida_star(table)), table.distance(puzzle.get_state()))
+            self.assertIsNone(table.distance(TilePuzzle([[2, 1, 3], [4, 5, 0]]).get_state()))
+
+    def test_optimal_moves(self):
+        """ Tests that optimal_moves reads optimal solutions off the distance tables and rejects other shapes """
+        # Time complexity: O(s × n × L) to build each table once, then O(d × n) per puzzle
+        # d is the solution length
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Unsolvable boards are rejected before any table is built
+            self.assertIsNone(TilePuzzle([[2, 1], [3, 0]]).optimal_moves(directory))
+            self.assertFalse(os.path.exists(os.path.join(directory, "distances_2x2.bin")))
+
+            puzzle = TilePuzzle([[4, 1, 2], [0, 8, 3], [7, 6, 5]])
+            moves = puzzle.optimal_moves(directory)
+            self.assertEqual(len(moves), 9)
+            self.assertTrue(os.path.exists(os.path.join(directory, "distances_3x3.bin")))
+            for move in moves:
+                self.assertTrue(puzzle.perform_move(move))
+            self.assertTrue(puzzle.is_solved())
+            self.assertEqual(puzzle.optimal_moves(directory), [])
+
+            for rows, cols in ((2, 2), (2, 3), (2, 4)):
+                puzzle = create_tile_puzzle(rows, cols)
+                puzzle.scramble(40)
+                self.assertEqual(len(puzzle.optimal_moves(directory)), len(puzzle.find_solution_a_star()))
+            self.assertIsNone(TilePuzzle([[2, 1, 3], [4, 5, 6], [7, 8, 0]]).optimal_moves(directory))
+            with self.assertRaises(ValueError):
+                create_tile_puzzle(3, 4).optimal_moves(directory)
+
+    def test_solve_many(self):
+        """ Tests that solve_many solves every board in a process pool and reports puzzles that hit their node budget """
+        # Time complexity: O(p × b^d) in worst case, spread over the workers
+        # p is the number of puzzles
+
+        boards = [[[4, 1, 2], [0, 8, 3], [7, 6, 5]], [[1, 2, 3], [4, 5, 6], [0, 7, 8]], [[1, 2], [0, 3]]]
+        results = sorted(solve_many(boards, algorithm="a_star", workers=2), key=lambda result: result.index)
+        self.assertEqual([result.status for result in results], ["solved"] * 3)
+        self.assertEqual([len(result.moves) for result in results], [9, 2, 1])
+        # Without a heuristic A* falls back to Manhattan distance, as it does when called directly
+        default = sorted(solve_many(boards, algorithm="a_star", heuristic=None, workers=2),
+                         key=lambda result: result.index)
+        self.assertEqual([result.nodes for result in default], [result.nodes for result in results])
+
+        with self.assertRaises(ValueError):
+            list(solve_many([create_tile_puzzle(4, 4)], heuristic="distances", workers=1))
+
+        # Shapes outside ORACLE_SHAPES use their table once it has been built
+        with tempfile.TemporaryDirectory() as directory:
+            tall = [[[3, 1], [0, 2], [5, 4]]]
+            with self.assertRaises(ValueError):
+                list(solve_many(tall, heuristic="distances", workers=1, directory=directory))
+            build_distance_table(3, 2, table_path(3, 2, directory))
+            result, = solve_many(tall, heuristic="distances", workers=1, directory=directory)
+            self.assertEqual(len(result.moves), len(TilePuzzle(tall[0]).find_solution_a_star()))
+
+        hard = [[[8, 7, 6], [5, 4, 3], [2, 1, 0]]]
+        result, = solve_many(hard, algorithm="ida_star", workers=1, max_nodes=50)
+        self.assertEqual(result.status, "limit")
+        self.assertIsNone(result.moves)
+
+    def test_find_solution_bidirectional(self):
+        """ Tests that both bidirectional solvers return optimal solutions and report where the searches met """
+        # Time complexity: O(b^(d/2))
+        # b is branching factor, d is depth of solution
+
+        puzzle = TilePuzzle([[4, 1, 2], [0, 8, 3], [7, 6, 5]])
+        for solver in (puzzle.find_solution_bidirectional_bfs, puzzle.find_solution_bidirectional_a_star):
+            stats = SearchStats()
+            path = solver(stats=stats)
+            self.assertEqual(len(path), 9)
+            self.assertTrue(0 <= stats.meeting_depth <= 9)
+            self.assertEqual(stats.forward_expanded + stats.backward_expanded, stats.expanded)
+
+            test_puzzle = puzzle.copy()
+            for move in path:
+                test_puzzle.perform_move(move)
+            self.assertTrue(test_puzzle.is_solved())
+
+    def test_is_solvable(self):
+        """ Tests the inversion parity check on odd and even widths, and that solvers give up at once on unsolvable boards """
+        # Time complexity: O(n log n)
+        # n is r × c
+
+        self.assertTrue(TilePuzzle([[4, 1, 2], [0, 8, 3], [7, 6, 5]]).is_solvable())
+        self.assertFalse(TilePuzzle([[2, 1, 3], [4, 5, 6], [7, 8, 0]]).is_solvable())
+        self.assertTrue(TilePuzzle([[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12], [13, 14, 0, 15]]).is_solvable())
+        self.assertFalse(TilePuzzle([[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12], [13, 15, 14, 0]]).is_solvable())
+        self.assertFalse(TilePuzzle([[2, 1, 0]]).is_solvable())
+
+        unsolvable = TilePuzzle([[2, 1, 3], [4, 5, 6], [7, 8, 0]])
+        self.assertIsNone(unsolvable.find_solution_a_star())
+        self.assertIsNone(unsolvable.find_solution_ida_star())
+        self.assertIsNone(unsolvable.find_solution_bidirectional_bfs())
+        self.assertEqual(list(unsolvable.find_solutions_iddfs()), [])
+
+    def test_scramble_uniform(self):
+        """ Tests that scrambling without a move count always produces a solvable board """
+        # Time complexity: O(n log n)
+        # n is r × c
+
+        for rows, cols in [(3, 3), (2, 4), (4, 4), (1, 5)]:
+            puzzle = create_tile_puzzle(rows, cols)
+            puzzle.scramble()
+            self.assertTrue(puzzle.is_solvable())
+            self.assertEqual(sorted(tile for row in puzzle.get_board() for tile in row), list(range(rows * cols)))
+
+    def test_find_solutions_iddfs_transposition_table(self):
+        """ Tests that find_solutions_iddfs stays optimal with a full, tiny or disabled transposition table """
+        # TIme complexity: worst case O(b^d)
+        # b is branching factor, d is depth of solution
+
+        puzzle = TilePuzzle([[4, 1, 2], [0, 8, 3], [7, 6, 5]])
+        for table_size in (1 << 18, 16, 0):
+            path = next(puzzle.find_solutions_iddfs(table_size=table_size))
+            self.assertEqual(len(path), 9)
+
+        layout = get_layout(3, 3)
+        state = puzzle.get_state()
+        moved = layout.move(state, puzzle.blank, 0)
+        tile = layout.unpack(state)[0]
+        # Zobrist hashes update incrementally with two XORs per move
+        self.assertEqual(layout.zobrist_hash(moved),
+                         layout.zobrist_hash(state) ^ layout.zobrist[tile][0] ^ layout.zobrist[tile][puzzle.blank])
+
+    def test_search_stats(self):
+        """ Tests that every solver fills in SearchStats and calls the progress callback every N expansions """
+        # Time complexity: O(b^d) in worst case
+        # b is branching factor, d is depth of solution
+
+        puzzle = TilePuzzle([[4, 1, 2], [0, 8, 3], [7, 6, 5]])
+        progress = []
+        stats = SearchStats(callback=lambda current: progress.append(current.expanded), every=2)
+        puzzle.find_solution_a_star(stats=stats)
+        self.assertEqual(stats.solution_length, 9)
+        self.assertGreaterEqual(stats.generated, stats.expanded)
+        self.assertGreater(stats.heuristic_calls, 0)
+        self.assertEqual(progress, list(range(2, stats.expanded + 1, 2)))
+
+        stats = SearchStats()
+        puzzle.find_solution_ida_star(stats=stats)
+        self.assertEqual(stats.iterations[-1][0], 9)
+        self.assertEqual(sum(expanded for _, _, expanded in stats.iterations), stats.expanded)
+
+        stats = SearchStats()
+        next(puzzle.find_solutions_iddfs(stats=stats))
+        self.assertEqual(len(stats.iterations), 10)
+        self.assertIn("frontier_peak", stats.as_dict())
+
+    def test_benchmark(self):
+        """ Tests that benchmark instance sets are reproducible and that every run reports optimality and speed """
+        # Time complexity: O(s + i × b^d)
+        # s is the number of reachable states, i the number of instances
+
+        instances = depth_instances(2, 3, [5, 9], 2, seed=3)
+        self.assertEqual(instances, depth_instances(2, 3, [5, 9], 2, seed=3))
+        self.assertEqual([instance["optimal"] for instance in instances], [5, 5, 9, 9])
+        for instance in instances:
+            self.assertEqual(len(TilePuzzle(instance["board"]).find_solution_a_star()), instance["optimal"])
+
+        # korf100 is built in and fixed, whatever the seed; a file of published instances replaces it
+        korf = instance_set("korf100", 100, seed=0)
+        self.assertEqual(len(korf), 100)
+        self.assertEqual(korf, instance_set("korf100", 100, seed=7))
+        self.assertEqual(instance_set("korf100", 3, seed=0), korf[:3])
+        self.assertTrue(all(TilePuzzle(instance["board"]).is_solvable() for instance in korf))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "korf100.txt")
+            with open(path, "w") as f:
+                f.write("1 14 13 15 7 11 12 9 5 6 0 2 1 4 8 10 3 57\n")
+            published, = instance_set("korf100", 100, seed=0, korf_path=path)
+            self.assertEqual(published["optimal"], 57)
+            self.assertTrue(TilePuzzle(published["board"]).is_solvable())
+
+        results = run_benchmark(["2x3"], ["a_star", "bidirectional_bfs"], count=2, time_limit=30)
+        summary = results["sets"]["2x3"]["summary"]
+        self.assertEqual(summary["a_star"]["solved"], 2)
+        self.assertEqual(summary["a_star"]["optimal"], 2)
+        self.assertEqual(summary["bidirectional_bfs"]["optimal"], 2)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,9 @@
-import copy
-import random
-import queue
+import heapq
 import itertools
-import queue
+import random
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
 
 '''
 A tile puzzle game where the only possible moves are to swap the empty tile with one of its neighboring tiles. 
@@ -12,6 +13,491 @@ and tiles 7 and 8 in the bottom row, with the empty space in the lower-right cor
 Two solvers for a generalized version of the Eight Puzzle, in which the board can have any number of rows and columns
 '''
 
+# Movement directions of the blank tile, in the order the solvers try them
+MOVES = ("up", "down", "left", "right")
+
+CHANGE = {
+    "up": (-1, 0),
+    "down": (1, 0),
+    "left": (0, -1),
+    "right": (0, 1)
+}
+
+OPPOSITE = {"up": "down", "down": "up", "left": "right", "right": "left"}
+
+
+def count_inversions(sequence):
+    """
+    Counts the pairs i < j with sequence[i] > sequence[j] using a merge sort
+    """
+    # Time complexity: O(n log n)
+
+    def sort_and_count(values):
+        """
+        Returns (sorted values, inversions among them)
+        """
+        if len(values) < 2:
+            return values, 0
+
+        middle = len(values) // 2
+        left, left_inversions = sort_and_count(values[:middle])
+        right, right_inversions = sort_and_count(values[middle:])
+
+        merged = []
+        inversions = left_inversions + right_inversions
+        i = j = 0
+        while i < len(left) and j < len(right):
+            if left[i] <= right[j]:
+                merged.append(left[i])
+                i += 1
+            else:
+                # right[j] is out of order with everything left in `left`
+                merged.append(right[j])
+                inversions += len(left) - i
+                j += 1
+        merged.extend(left[i:])
+        merged.extend(right[j:])
+        return merged, inversions
+
+    return sort_and_count(list(sequence))[1]
+
+
+class BoardLayout(object):
+    """
+    Precomputed tables shared by every puzzle of the same rows x cols shape.
+
+    A board state is packed into a single int: cell `pos` (row-major, pos = row * cols + col)
+    holds its tile in `bits` bits starting at bit `pos * bits`. States are immutable, hash and
+    compare in O(1), and a move is two shifts and an add instead of a deepcopy.
+    """
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.size = rows * cols
+        self.bits = max(1, (self.size - 1).bit_length())
+        self.mask = (1 << self.bits) - 1
+        self.shifts = tuple(pos * self.bits for pos in range(self.size))
+
+        # neighbors[pos] = ((move, new_blank_pos), ...) for every legal move of a blank at pos
+        neighbors = []
+        for pos in range(self.size):
+            row, col = divmod(pos, cols)
+            options = []
+            for move in MOVES:
+                dr, dc = CHANGE[move]
+                new_row, new_col = row + dr, col + dc
+                if 0 <= new_row < rows and 0 <= new_col < cols:
+                    options.append((move, new_row * cols + new_col))
+            neighbors.append(tuple(options))
+        self.neighbors = tuple(neighbors)
+        # targets[pos][move] = new_blank_pos, for single lookups by direction
+        self.targets = tuple(dict(options) for options in self.neighbors)
+
+        # Goal: tiles 1..size-1 in order, blank in the bottom-right corner
+        self.goal_blank = self.size - 1
+        self.goal = self.pack([(pos + 1) % self.size for pos in range(self.size)])
+
+        # distance[tile][pos] = Manhattan distance of `tile` at `pos` from its goal cell (0 for the blank)
+        distance = [[0] * self.size]
+        for tile in range(1, self.size):
+            target_row, target_col = divmod(tile - 1, cols)
+            distance.append([abs(pos // cols - target_row) + abs(pos % cols - target_col)
+                             for pos in range(self.size)])
+        self.distance = distance
+
+        # zobrist[tile][pos] = random 64-bit key; a state's hash is the XOR of the keys of its tiles,
+        # so a move updates it with two XORs. Seeded per shape so hashes are reproducible
+        rng = random.Random(rows * 1000003 + cols)
+        self.zobrist = [[0] * self.size] + [[rng.getrandbits(64) for _ in range(self.size)]
+                                            for _ in range(1, self.size)]
+
+    def pack(self, tiles):
+        """
+        Packs a flat, row-major sequence of tiles into a state int
+        """
+        state = 0
+        for shift, tile in zip(self.shifts, tiles):
+            state |= tile << shift
+        return state
+
+    def unpack(self, state):
+        """
+        Returns the flat, row-major list of tiles stored in a state int
+        """
+        mask = self.mask
+        return [(state >> shift) & mask for shift in self.shifts]
+
+    def encode(self, board):
+        """
+        Converts a list-of-lists board into (state, blank_pos)
+        """
+        tiles = [tile for row in board for tile in row]
+        return self.pack(tiles), tiles.index(0)
+
+    def decode(self, state):
+        """
+        Converts a state int back into a freshly allocated list-of-lists board
+        """
+        tiles = self.unpack(state)
+        return [tiles[row * self.cols:(row + 1) * self.cols] for row in range(self.rows)]
+
+    def find_blank(self, state):
+        """
+        Returns the position of the blank tile in a state int
+        """
+        # Time complexity: O(r × c)
+        mask = self.mask
+        for pos, shift in enumerate(self.shifts):
+            if not (state >> shift) & mask:
+                return pos
+        raise ValueError("state has no blank tile")
+
+    def move(self, state, blank, target):
+        """
+        Returns the state reached by sliding the tile at `target` into the blank at `blank`
+        """
+        # Time complexity: O(1)
+        tile = (state >> self.shifts[target]) & self.mask
+        return state + (tile << self.shifts[blank]) - (tile << self.shifts[target])
+
+    def zobrist_hash(self, state):
+        """
+        Computes the Zobrist hash of a state from scratch
+        """
+        # Time complexity: O(r × c)
+        mask, zobrist = self.mask, self.zobrist
+        key = 0
+        for pos, shift in enumerate(self.shifts):
+            key ^= zobrist[(state >> shift) & mask][pos]
+        return key
+
+    def manhattan(self, state):
+        """
+        Computes the Manhattan distance of a state from the goal state
+        """
+        # Time complexity: O(r × c)
+        mask = self.mask
+        distance = self.distance
+        return sum(distance[(state >> shift) & mask][pos] for pos, shift in enumerate(self.shifts))
+
+    def is_solvable(self, state):
+        """
+        Returns True if the goal can be reached from `state`.
+
+        Moving the blank sideways never changes the order of the tiles read row by row. Moving it
+        up or down carries one tile past the cols - 1 tiles between, changing the inversion count
+        by cols - 1. With an odd width the inversion parity is fixed, so it must be even like the
+        goal's. With an even width each vertical move also flips it, so inversions plus the blank's
+        row distance from the bottom must be even.
+        """
+        # Time complexity: O(n log n)
+        # n is r × c
+        tiles = self.unpack(state)
+        blank = tiles.index(0)
+        inversions = count_inversions([tile for tile in tiles if tile])
+
+        # Tiles on a single row or column can never pass each other
+        if self.rows == 1 or self.cols == 1:
+            return inversions == 0
+        if self.cols % 2:
+            return inversions % 2 == 0
+        return (inversions + self.rows - 1 - blank // self.cols) % 2 == 0
+
+    def random_state(self, rng=random):
+        """
+        Returns (state, blank_pos) drawn uniformly from all states that can reach the goal
+        """
+        # Time complexity: O(n log n)
+        tiles = list(range(self.size))
+        if self.rows == 1 or self.cols == 1:
+            # Only the blank can move around, the tiles stay in order
+            tiles = tiles[1:]
+            tiles.insert(rng.randrange(self.size), 0)
+        else:
+            rng.shuffle(tiles)
+            state = self.pack(tiles)
+            if not self.is_solvable(state):
+                # Swapping two tiles flips the parity and pairs every unsolvable
+                # board with exactly one solvable board, so the draw stays uniform
+                first, second = [pos for pos, tile in enumerate(tiles) if tile][:2]
+                tiles[first], tiles[second] = tiles[second], tiles[first]
+        return self.pack(tiles), tiles.index(0)
+
+
+@lru_cache(maxsize=None)
+def get_layout(rows, cols):
+    """
+    Returns the shared BoardLayout for a rows x cols board
+    """
+    return BoardLayout(rows, cols)
+
+
+class Heuristic(ABC):
+    """
+    Base class for admissible heuristics over the packed states of one board shape.
+    Subclasses implement estimate(); update() can be overridden with a cheaper incremental version.
+    """
+
+    def __init__(self, rows, cols):
+        self.layout = get_layout(rows, cols)
+
+    @abstractmethod
+    def estimate(self, state):
+        """
+        Returns a lower bound on the number of moves from `state` to the goal
+        """
+
+    def update(self, h, state, tile, src, dst):
+        """
+        Returns the estimate for `state`, reached by sliding `tile` from `src` to `dst`
+        from a parent whose estimate was `h`
+        """
+        return self.estimate(state)
+
+
+class ManhattanDistance(Heuristic):
+    """
+    Sum over all tiles of the row and column distance to their goal cells,
+    or to their cells in `target` (a packed state) when one is given
+    """
+
+    def __init__(self, rows, cols, target=None):
+        super().__init__(rows, cols)
+        layout = self.layout
+        if target is None:
+            self.distance = layout.distance
+        else:
+            # distance[tile][pos] against the target's placement of each tile (0 for the blank)
+            self.distance = [[0] * layout.size for _ in range(layout.size)]
+            for target_pos, tile in enumerate(layout.unpack(target)):
+                if tile == 0:
+                    continue
+                target_row, target_col = divmod(target_pos, cols)
+                self.distance[tile] = [abs(pos // cols - target_row) + abs(pos % cols - target_col)
+                                       for pos in range(layout.size)]
+
+    def estimate(self, state):
+        # Time complexity: O(r × c)
+        mask, distance = self.layout.mask, self.distance
+        return sum(distance[(state >> shift) & mask][pos] for pos, shift in enumerate(self.layout.shifts))
+
+    def update(self, h, state, tile, src, dst):
+        # Time complexity: O(1)
+        # Only the moved tile changes position
+        distance = self.distance[tile]
+        return h - distance[src] + distance[dst]
+
+
+class LinearConflict(ManhattanDistance):
+    """
+    Manhattan distance plus 2 moves for every tile that must leave its goal row (or column)
+    to let another tile in the same line pass it
+    """
+
+    def __init__(self, rows, cols):
+        super().__init__(rows, cols)
+        layout = self.layout
+        # Cells of every row and column, in order
+        self.row_cells = [tuple(range(row * cols, (row + 1) * cols)) for row in range(rows)]
+        self.col_cells = [tuple(range(col, layout.size, cols)) for col in range(cols)]
+        # Conflict penalty by line contents, lines repeat often during a search
+        self.cache = {}
+
+    def line_conflicts(self, tiles, index, is_row):
+        """
+        Returns the extra moves needed for the tiles of one row or column that already sit in
+        their goal line but in the wrong order: 2 × (tiles in the line - longest ordered subsequence)
+        """
+        key = (is_row, index, tiles)
+        if key in self.cache:
+            return self.cache[key]
+
+        cols = self.layout.cols
+        # Goal positions along the line of the tiles that belong to this line
+        order = []
+        for tile in tiles:
+            if tile == 0:
+                continue
+            goal_row, goal_col = divmod(tile - 1, cols)
+            if is_row and goal_row == index:
+                order.append(goal_col)
+            elif not is_row and goal_col == index:
+                order.append(goal_row)
+
+        # Longest increasing subsequence, lines are short so O(k^2) is fine
+        longest = [1] * len(order)
+        for i in range(len(order)):
+            for j in range(i):
+                if order[j] < order[i] and longest[j] + 1 > longest[i]:
+                    longest[i] = longest[j] + 1
+        penalty = 2 * (len(order) - max(longest, default=0))
+
+        self.cache[key] = penalty
+        return penalty
+
+    def lines(self, state, cells):
+        """
+        Returns the tiles of `state` in the given cells, as a tuple
+        """
+        mask, shifts = self.layout.mask, self.layout.shifts
+        return tuple((state >> shifts[pos]) & mask for pos in cells)
+
+    def estimate(self, state):
+        # Time complexity: O(r × c)
+        h = self.layout.manhattan(state)
+        for row, cells in enumerate(self.row_cells):
+            h += self.line_conflicts(self.lines(state, cells), row, True)
+        for col, cells in enumerate(self.col_cells):
+            h += self.line_conflicts(self.lines(state, cells), col, False)
+        return h
+
+    def update(self, h, state, tile, src, dst):
+        # Time complexity: O(r + c)
+        h = super().update(h, state, tile, src, dst)
+        parent = self.layout.move(state, src, dst)
+        cols = self.layout.cols
+
+        # A horizontal move only changes the contents of two columns, a vertical one two rows;
+        # the order of tiles along the other line is unchanged
+        if src // cols == dst // cols:
+            affected = [(src % cols, self.col_cells[src % cols]), (dst % cols, self.col_cells[dst % cols])]
+            is_row = False
+        else:
+            affected = [(src // cols, self.row_cells[src // cols]), (dst // cols, self.row_cells[dst // cols])]
+            is_row = True
+
+        for index, cells in affected:
+            h -= self.line_conflicts(self.lines(parent, cells), index, is_row)
+            h += self.line_conflicts(self.lines(state, cells), index, is_row)
+        return h
+
+
+class SearchStats(object):
+    """
+    Counters a solver fills in when one is passed as its `stats` argument.
+    Solvers only touch it when given, so searches without stats pay nothing for it.
+    `callback(stats)` is called every `every` expansions, e.g. to report progress.
+    """
+
+    def __init__(self, callback=None, every=10000):
+        self.callback = callback
+        self.every = every
+        self.expanded = 0
+        self.generated = 0
+        self.duplicates = 0  # Children dropped because their state was already reached as cheaply
+        self.frontier_peak = 0  # Open list size for A* and BFS, path length for depth-first solvers
+        self.heuristic_calls = 0
+        self.heuristic_time = 0.0
+        self.iterations = []  # (depth or f bound, seconds, expansions) per pass of IDDFS and IDA*
+        self.solution_length = None
+        self.elapsed = 0.0
+        # Bidirectional solvers only
+        self.forward_expanded = None
+        self.backward_expanded = None
+        self.forward_frontier = None
+        self.backward_frontier = None
+        self.meeting_depth = None
+
+        self.started = time.perf_counter()
+        self.iteration_start = None
+
+    def record_expansion(self, generated, frontier):
+        """
+        Counts one expanded node with `generated` children, with `frontier` nodes waiting
+        """
+        self.expanded += 1
+        self.generated += generated
+        if frontier > self.frontier_peak:
+            self.frontier_peak = frontier
+        if self.callback is not None and self.expanded % self.every == 0:
+            self.callback(self)
+
+    def start_iteration(self, bound):
+        self.iteration_start = (bound, time.perf_counter(), self.expanded)
+
+    def finish_iteration(self):
+        bound, started, expanded = self.iteration_start
+        self.iterations.append((bound, time.perf_counter() - started, self.expanded - expanded))
+
+    def finish_bidirectional(self, forward_frontier, backward_frontier, forward_expanded, backward_expanded,
+                             meeting_depth):
+        self.forward_frontier = forward_frontier
+        self.backward_frontier = backward_frontier
+        self.forward_expanded = forward_expanded
+        self.backward_expanded = backward_expanded
+        self.meeting_depth = meeting_depth
+
+    def finish(self, solution_length):
+        self.solution_length = solution_length
+        self.elapsed = time.perf_counter() - self.started
+
+    def nodes_per_second(self):
+        return self.expanded / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        """
+        Returns the counters as a plain dict, ready for JSON
+        """
+        return {name: value for name, value in vars(self).items()
+                if name not in ("callback", "every", "started", "iteration_start")}
+
+
+class TimedHeuristic(Heuristic):
+    """
+    Wraps a heuristic to count its calls into a SearchStats. Reading the clock costs about as much
+    as a Manhattan update, so only one call in `sample` is timed and the total is scaled up from those
+    """
+
+    def __init__(self, inner, stats, sample=16):
+        self.layout = inner.layout
+        self.inner = inner
+        self.stats = stats
+        self.sample = sample
+        self.timed_calls = 0
+        self.timed_seconds = 0.0
+
+    def timed(self, function, *args):
+        stats = self.stats
+        stats.heuristic_calls += 1
+        if stats.heuristic_calls % self.sample:
+            return function(*args)
+
+        started = time.perf_counter()
+        h = function(*args)
+        self.timed_seconds += time.perf_counter() - started
+        self.timed_calls += 1
+        stats.heuristic_time = self.timed_seconds * stats.heuristic_calls / self.timed_calls
+        return h
+
+    def estimate(self, state):
+        return self.timed(self.inner.estimate, state)
+
+    def update(self, h, state, tile, src, dst):
+        return self.timed(self.inner.update, h, state, tile, src, dst)
+
+
+def join_paths(forward_parents, backward_parents, meeting):
+    """
+    Builds the move list of a bidirectional search through the `meeting` state.
+    Parent maps hold state -> (previous state, move) or None at their root; backward moves
+    were made from the goal side, so they are reversed on the way out.
+    Returns (moves, number of those moves made by the forward search)
+    """
+    path = []
+    state = meeting
+    while forward_parents[state] is not None:
+        state, move = forward_parents[state]
+        path.append(move)
+    path.reverse()
+    meeting_depth = len(path)
+
+    state = meeting
+    while backward_parents[state] is not None:
+        state, move = backward_parents[state]
+        path.append(OPPOSITE[move])
+    return path, meeting_depth
+
 
 def create_tile_puzzle(rows, cols):
     """
@@ -36,87 +522,114 @@ def create_tile_puzzle(rows, cols):
 
     return TilePuzzle(board)
 
+
 class TilePuzzle(object):
     
     def __init__(self, board):
         """
         Initialize the TilePuzzle with a given board
         """
-        self.board = board
         # Number of columns (assuming rectangular board)
         self.cols = len(board[0]) if board else 0 # matrix[row][col]
         # Number of rows
         self.rows = len(board)
+        self.layout = get_layout(self.rows, self.cols)
+        # Packed board and cached blank position, see BoardLayout
+        self.state, self.blank = self.layout.encode(board)
+
+    @classmethod
+    def from_state(cls, rows, cols, state, blank=None):
+        """
+        Builds a TilePuzzle directly from a packed state int, without going through a board
+        """
+        puzzle = cls.__new__(cls)
+        puzzle.rows = rows
+        puzzle.cols = cols
+        puzzle.layout = get_layout(rows, cols)
+        puzzle.state = state
+        puzzle.blank = puzzle.layout.find_blank(state) if blank is None else blank
+        return puzzle
+
+    @property
+    def board(self):
+        """
+        The board as a read-only tuple of row tuples, decoded from the packed state.
+        Writing to a cell raises TypeError rather than silently changing a copy; assign a whole new
+        board to replace the state, or use get_board() for a mutable copy
+        """
+        return tuple(map(tuple, self.layout.decode(self.state)))
+
+    @board.setter
+    def board(self, board):
+        self.state, self.blank = self.layout.encode(board)
 
     def get_board(self):
         """
         Returns a deep copy of the current board state
         """
-        return copy.deepcopy(self.board)
+        return self.layout.decode(self.state)
+
+    def get_state(self):
+        """
+        Returns the packed state int of the current board
+        """
+        return self.state
 
     def perform_move(self, direction):
         """
         Attempts to move the blank (0) tile in the given direction
         Returns True if the move is successful, False otherwise
         """
-        # Find blank tile (0)
-        for i in range(self.rows):
-            for j in range(self.cols):
-                if self.board[i][j] == 0:
-                    row, col = i, j
-                    break
-            else:
-                continue
-            break
-
-        # Movement directions
-        change = {
-            "up": (-1, 0),
-            "down": (1, 0),
-            "left": (0, -1),
-            "right": (0, 1)
-        }
-
-        if direction not in change:
-            return False  # Invalid direction, off limits
-
-        dr, dc = change[direction]
-        new_row, new_col = row + dr, col + dc
+        # Time complexity: O(1)
+        target = self.layout.targets[self.blank].get(direction)
+        if target is None:
+            return False  # Invalid direction or move out of bounds
 
-        # Is the move within bounds?
-        if 0 <= new_row < self.rows and 0 <= new_col < self.cols:
-            # Swap the blank with the target tile
-            self.board[row][col], self.board[new_row][new_col] = self.board[new_row][new_col], self.board[row][col]
-            return True
+        # Swap the blank with the target tile
+        self.state = self.layout.move(self.state, self.blank, target)
+        self.blank = target
+        return True
 
-        return False  # Move out of bounds
-
-
-    def scramble(self, num_moves):
+    def scramble(self, num_moves=None, rng=random):
         """
         Randomly completes valid moves on the puzzle to scramble it
+        Without `num_moves`, jumps straight to a uniformly random solvable state instead
         """
-        moves = ["up", "down", "left", "right"]
-        successful_moves = 0
+        if num_moves is None:
+            self.state, self.blank = self.layout.random_state(rng)
+            return
 
-        while successful_moves < num_moves:
-            move = random.choice(moves)
-            if self.perform_move(move):
-                successful_moves += 1
+        # Time complexity: O(k)
+        # k is the number of moves to scramble
+        previous = None
+        for _ in range(num_moves):
+            # Pick among legal moves only, and avoid undoing the last move when there is another option
+            options = [target for _, target in self.layout.neighbors[self.blank] if target != previous]
+            target = rng.choice(options or [previous])
+            previous = self.blank
+            self.state = self.layout.move(self.state, self.blank, target)
+            self.blank = target
+
+    def is_solvable(self):
+        """
+        Returns True if the solved configuration can be reached from the current state
+        """
+        # Time complexity: O(n log n)
+        # n is r × c
+        return self.layout.is_solvable(self.state)
 
     def is_solved(self):
         """
         Returns True if the puzzle is in the solved configuration
         """
-        solved_board = [[i * self.cols + j + 1 for j in range(self.cols)] for i in range(self.rows)]
-        solved_board[self.rows - 1][self.cols - 1] = 0
-        return self.get_board() == solved_board
+        # Time complexity: O(1)
+        return self.state == self.layout.goal
 
     def copy(self):
         """
-        Return a new TilePuzzle object with a deep copy of the current board.
+        Return a new TilePuzzle object with a copy of the current board.
         """
-        return TilePuzzle(copy.deepcopy(self.board))
+        return TilePuzzle.from_state(self.rows, self.cols, self.state, self.blank)
 
     def successors(self):
         """
@@ -124,107 +637,422 @@ class TilePuzzle(object):
         Yields:
             (move: str, new_puzzle: TilePuzzle) for each valid move.
         """
-        for move in ["up", "down", "left", "right"]:
-            temp_board = self.copy()
-            if temp_board.perform_move(move):  # Only yield if move succeeded
-                yield (move, temp_board)
+        layout = self.layout
+        for move, target in layout.neighbors[self.blank]:
+            yield (move, TilePuzzle.from_state(self.rows, self.cols,
+                                               layout.move(self.state, self.blank, target), target))
 
 
-    def find_solutions_iddfs(self):
+    def optimal_moves(self, directory=None):
+        """
+        Returns an optimal list of moves read from the precomputed distance table of this shape,
+        without any search. The table is loaded on the first call; for the small shapes in
+        distance_table.ORACLE_SHAPES (2x2, 2x3, 2x4, 3x3) it is built and saved first if it is not on disk yet,
+        other shapes need it built beforehand (see get_distance_table)
+        Tables live in `directory`, the pattern database cache by default
+        Returns None if the puzzle is unsolvable, without loading or building any table
+        """
+        # Time complexity: O(d × r × c)
+        # d is the solution length
+        if not self.is_solvable():
+            return None  # Checked first, so an unsolvable board never builds a table
+        # Imported here because distance_table builds on this module
+        from distance_table import get_distance_table
+        from pattern_database import CACHE_DIR
+        return get_distance_table(self.rows, self.cols, directory or CACHE_DIR).solution(self.state)
+
+    def find_solutions_iddfs(self, heuristic=None, table_size=1 << 18, stats=None):
         """
         Solves the tile puzzle using Iterative Deepening Depth-First Search (IDDFS)
+        An optional admissible Heuristic prunes branches that cannot reach the goal within the depth limit
+        A transposition table of `table_size` slots (0 disables it) is kept across iterations,
+        so states already searched at least as deep are not expanded again
+        Fills the optional SearchStats `stats` as it goes
         Yields a list of moves (strings) that lead to the solved puzzle state
         """
+        if not self.is_solvable():
+            return  # Fail fast, the goal is unreachable
+
+        layout = self.layout
+        neighbors, shifts, mask, goal = layout.neighbors, layout.shifts, layout.mask, layout.goal
+        zobrist = layout.zobrist
+        if stats is not None and heuristic is not None:
+            heuristic = TimedHeuristic(heuristic, stats)
+        update = heuristic.update if heuristic is not None else None
+
+        # Transposition table indexed by the low bits of the Zobrist hash. A slot holds a state and
+        # the largest remaining depth it has been searched with; a deeper entry is never replaced
+        # by a shallower one. Entries are added as a state is entered, which also cuts cycles
+        slots = 1 << (table_size - 1).bit_length() if table_size > 0 else 0
+        slot_mask = slots - 1
+        table_states = [None] * slots
+        table_depths = [0] * slots
 
-        def recursive_dfs(puzzle, depth_limit, path, seen_states):
+        path = []
+
+        def recursive_dfs(state, blank, key, depth_limit, h, previous):
             """
             Recursively explore puzzle states up to a given depth
             """
-            if puzzle.is_solved():
-                yield path
+            if state == goal:
+                yield list(path)
                 return
 
             if depth_limit == 0:
                 return
 
-            # Create a hashable version of the board to track visited states
-            board_tuple = tuple(tuple(row) for row in puzzle.get_board())
-            seen_states.add(board_tuple)
-
-            for move in ["up", "down", "left", "right"]:
-                next_puzzle = puzzle.copy()
-                if next_puzzle.perform_move(move):
-                    next_board_tuple = tuple(tuple(row) for row in next_puzzle.get_board())
-                    if next_board_tuple not in seen_states:
-                        yield from recursive_dfs(
-                            next_puzzle,
-                            depth_limit - 1,
-                            path + [move],
-                            seen_states
-                        )
-
-            # Backtrack so this state can be explored again in other paths
-            seen_states.remove(board_tuple)
+            if slots:
+                slot = key & slot_mask
+                if table_states[slot] == state and table_depths[slot] >= depth_limit:
+                    if stats is not None:
+                        stats.duplicates += 1
+                    return  # Already searched at least this deep without reaching the goal
+                if depth_limit >= table_depths[slot]:
+                    table_states[slot] = state
+                    table_depths[slot] = depth_limit
+
+            if stats is not None:
+                # Every neighbor except the one we came from is generated
+                stats.record_expansion(len(neighbors[blank]) - (previous >= 0), len(path))
+
+            for move, target in neighbors[blank]:
+                # Moving the blank straight back would undo the previous move
+                if target == previous:
+                    continue
+
+                tile = (state >> shifts[target]) & mask
+                child = state + (tile << shifts[blank]) - (tile << shifts[target])
+
+                child_h = 0
+                if update is not None:
+                    child_h = update(h, child, tile, target, blank)
+                    if child_h >= depth_limit:
+                        continue  # Goal is out of reach within this iteration
+
+                path.append(move)
+                yield from recursive_dfs(child, target, key ^ zobrist[tile][target] ^ zobrist[tile][blank],
+                                         depth_limit - 1, child_h, blank)
+                path.pop()
 
         # Main loop
-        depth = 0
+        initial_h = heuristic.estimate(self.state) if heuristic is not None else 0
+        initial_key = layout.zobrist_hash(self.state)
+        depth = initial_h
         while True:
-            seen_states = set()
-            for solution in recursive_dfs(self.copy(), depth, [], seen_states):
+            if stats is not None:
+                stats.start_iteration(depth)
+            for solution in recursive_dfs(self.state, self.blank, initial_key, depth, initial_h, -1):
+                if stats is not None:
+                    stats.finish_iteration()
+                    stats.finish(len(solution))
                 yield solution
                 return  # Stop after first found solution
+            if stats is not None:
+                stats.finish_iteration()
             depth += 1
 
 
-    def find_solution_a_star(self):
+    def find_solution_a_star(self, heuristic=None, stats=None):
         """
-        Solves the puzzle using the A* search algorithm with Manhattan distance as the heuristic
+        Solves the puzzle using the A* search algorithm, with Manhattan distance as the default heuristic
+        Fills the optional SearchStats `stats` as it goes
         Returns a list of moves that solves the puzzle from the current state
         """
+        if not self.is_solvable():
+            return None  # Fail fast, the goal is unreachable
 
-        def manhattan_distance(board):
+        layout = self.layout
+        neighbors, shifts, mask, goal = layout.neighbors, layout.shifts, layout.mask, layout.goal
+        if heuristic is None:
+            heuristic = ManhattanDistance(self.rows, self.cols)
+        if stats is not None:
+            heuristic = TimedHeuristic(heuristic, stats)
+        update = heuristic.update
+
+        start = self.state
+        # parents[state] = (previous state, move), the path is rebuilt once the goal is reached
+        parents = {start: None}
+        best_g = {start: 0}
+        tie_breaker = itertools.count()
+
+        initial_h = heuristic.estimate(start)
+        # Entries are (f, h, tie, g, state, blank); ties on f go to the deeper node
+        frontier = [(initial_h, initial_h, next(tie_breaker), 0, start, self.blank)]
+
+        while frontier:
+            _, h, _, move_count, state, blank = heapq.heappop(frontier)
+
+            if state == goal:
+                path = []
+                while parents[state] is not None:
+                    state, move = parents[state]
+                    path.append(move)
+                path.reverse()
+                if stats is not None:
+                    stats.finish(len(path))
+                return path
+
+            # Skip entries superseded by a cheaper path to the same state
+            if move_count > best_g[state]:
+                continue
+
+            if stats is not None:
+                stats.record_expansion(len(neighbors[blank]), len(frontier))
+
+            g = move_count + 1
+            for move, target in neighbors[blank]:
+                tile = (state >> shifts[target]) & mask
+                successor = state + (tile << shifts[blank]) - (tile << shifts[target])
+
+                if g < best_g.get(successor, g + 1):
+                    best_g[successor] = g
+                    parents[successor] = (state, move)
+                    successor_h = update(h, successor, tile, target, blank)
+                    heapq.heappush(frontier, (g + successor_h, successor_h, next(tie_breaker),
+                                              g, successor, target))
+                elif stats is not None:
+                    stats.duplicates += 1
+
+        if stats is not None:
+            stats.finish(None)
+        return None
+
+
+    def find_solution_ida_star(self, heuristic=None, stats=None):
+        """
+        Solves the puzzle using Iterative Deepening A* (IDA*), with Manhattan distance as the default heuristic
+        Runs depth-first passes bounded by f = g + h, so memory grows with the solution depth only
+        Fills the optional SearchStats `stats` as it goes
+        Returns a list of moves that solves the puzzle from the current state
+        """
+        # Time complexity: O(b^d) in worst case, far less with a good heuristic
+        # Space complexity: O(d)
+        if not self.is_solvable():
+            return None  # Fail fast, the goal is unreachable
+
+        layout = self.layout
+        neighbors, shifts, mask, goal = layout.neighbors, layout.shifts, layout.mask, layout.goal
+        if heuristic is None:
+            heuristic = ManhattanDistance(self.rows, self.cols)
+        if stats is not None:
+            heuristic = TimedHeuristic(heuristic, stats)
+        update = heuristic.update
+
+        path = []
+        found = -1  # Returned instead of a bound once the goal is reached
+
+        def search(state, blank, g, h, bound, previous):
             """
-            Computes the Manhattan distance of a board configuration from the goal state
+            Explores below `state` without exceeding `bound`
+            Returns `found`, or the smallest f that went over the bound
             """
-            distance = 0
-            for row in range(self.rows):
-                for col in range(self.cols):
-                    tile = board[row][col]
-                    if tile == 0:
+            if state == goal:
+                return found
+
+            if stats is not None:
+                # Every neighbor except the one we came from is generated
+                stats.record_expansion(len(neighbors[blank]) - (previous >= 0), g)
+
+            next_bound = float("inf")
+            child_g = g + 1
+            for move, target in neighbors[blank]:
+                # Moving the blank straight back would undo the previous move
+                if target == previous:
+                    continue
+
+                # Make the move; states are immutable ints, so unmaking it is free
+                tile = (state >> shifts[target]) & mask
+                child = state + (tile << shifts[blank]) - (tile << shifts[target])
+                child_h = update(h, child, tile, target, blank)
+                f = child_g + child_h
+                if f > bound:
+                    if f < next_bound:
+                        next_bound = f
+                    continue
+
+                path.append(move)
+                result = search(child, target, child_g, child_h, bound, blank)
+                if result == found:
+                    return found
+                path.pop()
+
+                if result < next_bound:
+                    next_bound = result
+            return next_bound
+
+        initial_h = heuristic.estimate(self.state)
+        bound = initial_h
+        while True:
+            if stats is not None:
+                stats.start_iteration(bound)
+            result = search(self.state, self.blank, 0, initial_h, bound, -1)
+            if stats is not None:
+                stats.finish_iteration()
+            if result == found:
+                if stats is not None:
+                    stats.finish(len(path))
+                return path
+            if result == float("inf"):
+                if stats is not None:
+                    stats.finish(None)
+                return None  # Every move was exhausted without reaching the goal
+            bound = result
+
+
+    def find_solution_bidirectional_bfs(self, stats=None):
+        """
+        Solves the puzzle with a breadth-first search from both the current state and the goal,
+        always growing the smaller frontier by one full layer until the two searches meet
+        Fills the optional SearchStats `stats`, including frontier sizes per side and the meeting depth
+        Returns a list of moves that solves the puzzle from the current state
+        """
+        # Time complexity: O(b^(d/2))
+        # b is branching factor, d is depth of solution
+        if not self.is_solvable():
+            return None  # Fail fast, the goal is unreachable
+
+        layout = self.layout
+        neighbors, shifts, mask = layout.neighbors, layout.shifts, layout.mask
+
+        start, goal = self.state, layout.goal
+        forward_parents = {start: None}
+        backward_parents = {goal: None}
+        forward = [(start, self.blank)]
+        backward = [(goal, layout.goal_blank)]
+        expanded = {"forward": 0, "backward": 0}
+        meeting = start if start == goal else None
+
+        while meeting is None and forward and backward:
+            # Grow the smaller side, its next layer is the cheaper one to build
+            if len(forward) <= len(backward):
+                side, frontier, parents, others = "forward", forward, forward_parents, backward_parents
+            else:
+                side, frontier, parents, others = "backward", backward, backward_parents, forward_parents
+
+            next_frontier = []
+            for state, blank in frontier:
+                expanded[side] += 1
+                if stats is not None:
+                    stats.record_expansion(len(neighbors[blank]), len(forward) + len(backward) + len(next_frontier))
+                for move, target in neighbors[blank]:
+                    tile = (state >> shifts[target]) & mask
+                    child = state + (tile << shifts[blank]) - (tile << shifts[target])
+                    if child in parents:
+                        if stats is not None:
+                            stats.duplicates += 1
                         continue
-                    # Calculate target position for current tile
-                    target_row = (tile - 1) // self.cols
-                    target_col = (tile - 1) % self.cols
-                    distance += abs(row - target_row) + abs(col - target_col)
-            return distance
-
-        start_state = self.copy()
-        seen = set()
+                    parents[child] = (state, move)
+                    # Both sides hold exact BFS depths, so the first contact is a shortest path
+                    if child in others:
+                        meeting = child
+                        break
+                    next_frontier.append((child, target))
+                if meeting is not None:
+                    break
+
+            if side == "forward":
+                forward = next_frontier
+            else:
+                backward = next_frontier
+
+        path, meeting_depth = None, None
+        if meeting is not None:
+            path, meeting_depth = join_paths(forward_parents, backward_parents, meeting)
+        if stats is not None:
+            stats.finish_bidirectional(len(forward), len(backward), expanded["forward"], expanded["backward"],
+                                       meeting_depth)
+            stats.finish(None if path is None else len(path))
+        return path
+
+
+    def find_solution_bidirectional_a_star(self, heuristic=None, stats=None):
+        """
+        Solves the puzzle with MM, a bidirectional A* that meets in the middle: both searches order
+        their frontiers by max(f, 2g) and the side with the lower minimum is expanded next.
+        The forward search uses `heuristic` (Manhattan distance by default), the backward search the
+        Manhattan distance to the current state
+        Fills the optional SearchStats `stats`, including frontier sizes per side and the meeting depth
+        Returns a list of moves that solves the puzzle from the current state
+        """
+        if not self.is_solvable():
+            return None  # Fail fast, the goal is unreachable
+
+        layout = self.layout
+        neighbors, shifts, mask = layout.neighbors, layout.shifts, layout.mask
+        if heuristic is None:
+            heuristic = ManhattanDistance(self.rows, self.cols)
+        backward_heuristic = ManhattanDistance(self.rows, self.cols, target=self.state)
+        if stats is not None:
+            heuristic = TimedHeuristic(heuristic, stats)
+            backward_heuristic = TimedHeuristic(backward_heuristic, stats)
+
+        start, goal = self.state, layout.goal
         tie_breaker = itertools.count()
-        frontier = queue.PriorityQueue()
+        sides = {}
+        for side, root, blank, side_heuristic in (("forward", start, self.blank, heuristic),
+                                                  ("backward", goal, layout.goal_blank, backward_heuristic)):
+            h = side_heuristic.estimate(root)
+            sides[side] = {
+                "heuristic": side_heuristic,
+                "parents": {root: None},
+                "g": {root: 0},
+                # Entries are (priority, f, tie, g, state, blank, h)
+                "frontier": [(h, h, next(tie_breaker), 0, root, blank, h)],
+                "expanded": 0,
+            }
+        forward, backward = sides["forward"], sides["backward"]
+
+        def top(side):
+            """
+            Drops entries superseded by a cheaper path and returns the lowest priority left
+            """
+            frontier, g = side["frontier"], side["g"]
+            while frontier and frontier[0][3] > g[frontier[0][4]]:
+                heapq.heappop(frontier)
+            return frontier[0][0] if frontier else float("inf")
 
-        initial_cost = manhattan_distance(start_state.get_board())
-        frontier.put((initial_cost, 0, next(tie_breaker), start_state, []))
+        best = 0 if start == goal else float("inf")
+        meeting = start if start == goal else None
 
-        while not frontier.empty():
-            _, move_count, _, current_state, path = frontier.get()
+        while forward["frontier"] and backward["frontier"]:
+            forward_top, backward_top = top(forward), top(backward)
+            # min(forward_top, backward_top) never exceeds the optimal cost,
+            # so once the best path found is that cheap it is optimal
+            if best <= min(forward_top, backward_top):
+                break
 
-            if current_state.is_solved():
-                return path
+            side, other = (forward, backward) if forward_top <= backward_top else (backward, forward)
+            _, _, _, g, state, blank, h = heapq.heappop(side["frontier"])
+            side["expanded"] += 1
+            if stats is not None:
+                stats.record_expansion(len(neighbors[blank]), len(forward["frontier"]) + len(backward["frontier"]))
 
-            board_tuple = tuple(tuple(row) for row in current_state.get_board())
-            if board_tuple in seen:
-                continue
-            seen.add(board_tuple)
+            update, parents, best_g, others = side["heuristic"].update, side["parents"], side["g"], other["g"]
+            child_g = g + 1
+            for move, target in neighbors[blank]:
+                tile = (state >> shifts[target]) & mask
+                child = state + (tile << shifts[blank]) - (tile << shifts[target])
+                if child_g >= best_g.get(child, child_g + 1):
+                    if stats is not None:
+                        stats.duplicates += 1
+                    continue
 
-            for move, successor in current_state.successors():
-                successor_board = successor.get_board()
-                successor_tuple = tuple(tuple(row) for row in successor_board)
+                best_g[child] = child_g
+                parents[child] = (state, move)
+                if child in others and child_g + others[child] < best:
+                    best = child_g + others[child]
+                    meeting = child
 
-                if successor_tuple not in seen:
-                    g = move_count + 1
-                    h = manhattan_distance(successor_board)
-                    f = g + h
-                    frontier.put((f, g, next(tie_breaker), successor, path + [move]))
+                child_h = update(h, child, tile, target, blank)
+                f = child_g + child_h
+                heapq.heappush(side["frontier"], (max(f, 2 * child_g), f, next(tie_breaker),
+                                                  child_g, child, target, child_h))
 
-        return None
\ No newline at end of file
+        path, meeting_depth = None, None
+        if meeting is not None:
+            path, meeting_depth = join_paths(forward["parents"], backward["parents"], meeting)
+        if stats is not None:
+            stats.finish_bidirectional(len(forward["frontier"]), len(backward["frontier"]),
+                                       forward["expanded"], backward["expanded"], meeting_depth)
+            stats.finish(None if path is None else len(path))
+        return path